@@ -0,0 +1,110 @@
+import asyncio
+import collections
+import os
+
+# Control de admisión y backpressure.
+# Limita cuántos streams de /ws/transcribe y cuántas peticiones de /transcribe se atienden
+# a la vez. Cuando se llega al límite, las conexiones nuevas se rechazan con una pista de
+# cuándo reintentar, en lugar de aceptar todo y que todos los streams vayan más lentos
+# que el tiempo real.
+
+# Límites (0 = sin límite).
+MAX_STREAMS = int(os.environ.get("MAX_STREAMS", 0))
+MAX_FILE_JOBS = int(os.environ.get("MAX_FILE_JOBS", 0))
+# Bytes de audio recibidos y pendientes de decodificar que se aceptan por conexión.
+MAX_BUFFERED_BYTES = int(os.environ.get("MAX_BUFFERED_BYTES", 256 * 1024))
+# Segundos sugeridos al cliente antes de reintentar (cabecera Retry-After / campo 'retry_after').
+RETRY_AFTER_SECONDS = int(os.environ.get("RETRY_AFTER_SECONDS", 5))
+
+# Variable global con el controlador compartido (se crea una sola vez al iniciar la aplicación).
+ADMISSION = None
+
+
+class AdmissionController:
+    """Cuenta los streams y archivos en curso y decide si se admiten nuevos."""
+
+    def __init__(self, max_streams=MAX_STREAMS, max_file_jobs=MAX_FILE_JOBS, retry_after=RETRY_AFTER_SECONDS):
+        self.max_streams = max_streams
+        self.max_file_jobs = max_file_jobs
+        self.retry_after = retry_after
+        self.streams = 0
+        self.file_jobs = 0
+        self.rejected_streams = 0
+        self.rejected_file_jobs = 0
+        self.backpressure_pauses = 0
+
+    def admit_stream(self, overloaded=False):
+        """Reserva un stream. Devuelve False si hay que rechazarlo."""
+        if overloaded or (self.max_streams and self.streams >= self.max_streams):
+            self.rejected_streams += 1
+            return False
+        self.streams += 1
+        return True
+
+    def release_stream(self):
+        self.streams -= 1
+
+    def admit_file_job(self, overloaded=False):
+        """Reserva una petición de /transcribe. Devuelve False si hay que rechazarla."""
+        if overloaded or (self.max_file_jobs and self.file_jobs >= self.max_file_jobs):
+            self.rejected_file_jobs += 1
+            return False
+        self.file_jobs += 1
+        return True
+
+    def release_file_job(self):
+        self.file_jobs -= 1
+
+    def stats(self):
+        return {
+            "streams": self.streams,
+            "max_streams": self.max_streams,
+            "file_jobs": self.file_jobs,
+            "max_file_jobs": self.max_file_jobs,
+            "rejected_streams": self.rejected_streams,
+            "rejected_file_jobs": self.rejected_file_jobs,
+            "backpressure_pauses": self.backpressure_pauses,
+        }
+
+
+class AudioBuffer:
+    """Cola de mensajes de un cliente limitada en bytes.
+
+    Si la decodificación se retrasa y la cola se llena, quien lee del socket espera:
+    así dejamos de leer y el propio TCP frena al cliente, sin acumular memoria.
+    """
+
+    def __init__(self, max_bytes=MAX_BUFFERED_BYTES, controller=None):
+        self.max_bytes = max_bytes
+        self.size = 0
+        self._controller = controller
+        self._items = collections.deque()
+        self._changed = asyncio.Condition()
+
+    def _fits(self, size):
+        # Un mensaje siempre cabe en una cola vacía, aunque sea más grande que el límite.
+        return self.size == 0 or self.size + size <= self.max_bytes
+
+    async def put(self, item, size):
+        async with self._changed:
+            if not self._fits(size):
+                if self._controller is not None:
+                    self._controller.backpressure_pauses += 1
+                await self._changed.wait_for(lambda: self._fits(size))
+            self._items.append((item, size))
+            self.size += size
+            self._changed.notify_all()
+
+    async def get(self):
+        async with self._changed:
+            await self._changed.wait_for(lambda: self._items)
+            item, size = self._items.popleft()
+            self.size -= size
+            self._changed.notify_all()
+            return item
+
+
+def create_admission_controller():
+    """Crea el controlador de admisión compartido."""
+    global ADMISSION
+    ADMISSION = AdmissionController()
@@ -0,0 +1,382 @@
+import asyncio
+import contextlib
+import mmap
+import os
+import shutil
+import struct
+import tempfile
+import time
+import numpy as np
+from . import metrics
+
+# Este módulo convierte audio con FFmpeg usando tuberías (pipes) en lugar de archivos temporales.
+# El archivo subido se envía a FFmpeg por stdin y el PCM resultante se lee por stdout
+# en bloques de tamaño fijo, de modo que la conversión y el reconocimiento se solapan
+# y la memoria usada no depende de la duración del audio. Los contenedores que no se pueden
+# leer por pipe se convierten dándole a FFmpeg el archivo (ver 'ffmpeg_pcm_chunks').
+# Si el archivo ya es un WAV PCM s16le a 16 kHz mono, no se usa FFmpeg: se lee directamente
+# la parte de datos del WAV (ver 'upload_pcm_chunks').
+
+# Formato que necesita Vosk: PCM s16le, 16 kHz, mono.
+PCM_SAMPLE_RATE = 16000
+PCM_SAMPLE_WIDTH = 2
+
+# Tamaño de cada bloque PCM que se entrega al reconocedor (8000 bytes = 0.25 s a 16 kHz).
+PCM_CHUNK_SIZE = int(os.environ.get("PCM_CHUNK_SIZE", 8000))
+# Máximo de canales que se decodifican por separado ('multichannel' de /transcribe).
+MAX_CHANNELS = int(os.environ.get("MAX_CHANNELS", 8))
+# Tamaño de cada lectura del archivo subido al alimentar a FFmpeg.
+UPLOAD_READ_SIZE = 64 * 1024
+
+# Parámetros para dividir archivos largos en los silencios (modo paralelo de /transcribe).
+SILENCE_FRAME_MS = 30
+SILENCE_MIN_MS = int(os.environ.get("SILENCE_MIN_MS", 300))
+SEGMENT_MIN_SECONDS = float(os.environ.get("SEGMENT_MIN_SECONDS", 15))
+# Segundos de audio que se analizan a la vez al buscar los silencios (limita la memoria usada).
+SILENCE_BLOCK_SECONDS = 10
+# Energía (RMS) por debajo de la cual un frame se considera silencio, aunque el audio sea muy bajo.
+SILENCE_MIN_RMS = 100
+
+
+class ConversionError(Exception):
+    """Error de FFmpeg al convertir el audio."""
+
+    def __init__(self, details):
+        super().__init__(details)
+        self.details = details
+
+
+async def _feed_ffmpeg(stdin, source):
+    # Copia el archivo de entrada a stdin de FFmpeg por bloques.
+    # Las lecturas se hacen en un hilo porque el archivo subido puede estar en disco.
+    loop = asyncio.get_running_loop()
+    try:
+        while True:
+            data = await loop.run_in_executor(None, source.read, UPLOAD_READ_SIZE)
+            if not data:
+                break
+            stdin.write(data)
+            await stdin.drain()
+    except (BrokenPipeError, ConnectionResetError):
+        # FFmpeg terminó antes de leer toda la entrada (por ejemplo, formato inválido).
+        # El error real se reporta con su código de salida y stderr.
+        pass
+    finally:
+        stdin.close()
+
+
+def _seekable_file(source):
+    # Da a FFmpeg acceso al archivo subido como un archivo normal (con saltos), no como pipe.
+    # Devuelve (descriptor que hereda FFmpeg, copia temporal que hay que cerrar o None). Si el
+    # archivo solo está en memoria (SpooledTemporaryFile sin pasar a disco, BytesIO), se copia.
+    raw = getattr(source, "_file", source)
+    try:
+        raw.flush()
+        return raw.fileno(), None
+    except (AttributeError, OSError):
+        pass
+    copy = tempfile.TemporaryFile()
+    source.seek(0)
+    shutil.copyfileobj(source, copy, UPLOAD_READ_SIZE)
+    copy.flush()
+    return copy.fileno(), copy
+
+
+async def _run_ffmpeg(source, chunk_size, sample_rate, channels, fd=None):
+    # Una ejecución de FFmpeg. Sin 'fd' el archivo se le envía por stdin (pipe:0); con 'fd'
+    # lo abre él mismo desde /dev/fd, como un archivo normal en el que puede saltar.
+    input_path = "pipe:0" if fd is None else f"/dev/fd/{fd}"
+    ffmpeg_command = [
+        "ffmpeg", "-hide_banner", "-loglevel", "error",
+        "-i", input_path, "-f", "s16le",
+        "-ar", str(sample_rate), "-ac", str(channels), "pipe:1"
+    ]
+    started = time.perf_counter()
+    process = await asyncio.create_subprocess_exec(
+        *ffmpeg_command,
+        stdin=asyncio.subprocess.PIPE if fd is None else asyncio.subprocess.DEVNULL,
+        stdout=asyncio.subprocess.PIPE,
+        stderr=asyncio.subprocess.PIPE,
+        pass_fds=() if fd is None else (fd,),
+    )
+    feeder = asyncio.create_task(_feed_ffmpeg(process.stdin, source)) if fd is None else None
+    # Leemos stderr en paralelo para que FFmpeg nunca se bloquee con el buffer lleno.
+    stderr_reader = asyncio.create_task(process.stderr.read())
+
+    try:
+        while True:
+            try:
+                chunk = await process.stdout.readexactly(chunk_size)
+            except asyncio.IncompleteReadError as e:
+                # Último bloque (más corto) al llegar al final del stream.
+                if e.partial:
+                    yield e.partial
+                break
+            yield chunk
+
+        if feeder is not None:
+            await feeder
+        returncode = await process.wait()
+        metrics.FFMPEG_SECONDS.observe(time.perf_counter() - started)
+        stderr = await stderr_reader
+        if returncode != 0:
+            raise ConversionError(stderr.decode(errors="replace"))
+    finally:
+        # Si el consumidor se detiene antes de tiempo, terminamos FFmpeg y las tareas auxiliares.
+        if process.returncode is None:
+            process.kill()
+            # Vaciamos stdout: si su lectura quedó pausada (buffer lleno), asyncio no ve el cierre
+            # del pipe y 'wait' no terminaría nunca.
+            await process.stdout.read()
+            await process.wait()
+        if feeder is not None:
+            feeder.cancel()
+        stderr_reader.cancel()
+
+
+async def ffmpeg_pcm_chunks(source, chunk_size=PCM_CHUNK_SIZE, sample_rate=PCM_SAMPLE_RATE, channels=1):
+    """Convierte 'source' (objeto tipo archivo) a PCM s16le con FFmpeg y produce bloques de tamaño fijo.
+
+    Primero se intenta por pipe, que solapa la lectura con la conversión. Algunos contenedores
+    no se pueden leer así (p. ej. MP4/M4A con el índice 'moov' al final, típico de los móviles):
+    si FFmpeg falla sin haber producido audio, se repite dándole el archivo con acceso aleatorio.
+    """
+    produced = False
+    chunks = _run_ffmpeg(source, chunk_size, sample_rate, channels)
+    try:
+        async for chunk in chunks:
+            produced = True
+            yield chunk
+        return
+    except ConversionError:
+        if produced:
+            raise
+    finally:
+        # Cerramos la conversión en el momento (también si el consumidor se detiene antes de tiempo).
+        await chunks.aclose()
+    loop = asyncio.get_running_loop()
+    # La copia a un temporal (si hace falta) se hace en un hilo.
+    fd, copy = await loop.run_in_executor(None, _seekable_file, source)
+    chunks = _run_ffmpeg(source, chunk_size, sample_rate, channels, fd)
+    try:
+        async for chunk in chunks:
+            yield chunk
+    finally:
+        await chunks.aclose()
+        if copy is not None:
+            copy.close()
+
+
+# ----------------------------------------------------------------------
+## Camino rápido para WAV ya conformes (sin FFmpeg)
+# ----------------------------------------------------------------------
+
+# Códigos de formato del chunk 'fmt ' de un WAV.
+WAVE_FORMAT_PCM = 0x0001
+WAVE_FORMAT_EXTENSIBLE = 0xFFFE
+
+
+def _read_wav_header(source):
+    # Recorre los chunks RIFF y devuelve (formato, canales, frecuencia, bits, posición, tamaño)
+    # de los datos de audio, o None si no es un WAV que se entienda. Deja el archivo al principio.
+    try:
+        source.seek(0, os.SEEK_END)
+        file_size = source.tell()
+        source.seek(0)
+        header = source.read(12)
+        if len(header) < 12 or header[:4] != b"RIFF" or header[8:12] != b"WAVE":
+            return None
+        position = 12
+        fmt = None
+        while position + 8 <= file_size:
+            source.seek(position)
+            chunk_id, chunk_size = struct.unpack("<4sI", source.read(8))
+            if chunk_id == b"fmt ":
+                data = source.read(min(chunk_size, 40))
+                if len(data) < 16:
+                    return None
+                tag, channels, rate, _, _, bits = struct.unpack("<HHIIHH", data[:16])
+                if tag == WAVE_FORMAT_EXTENSIBLE and len(data) >= 26:
+                    # En WAVE_FORMAT_EXTENSIBLE el formato real son los 2 primeros bytes del SubFormat.
+                    tag = struct.unpack("<H", data[24:26])[0]
+                fmt = (tag, channels, rate, bits)
+            elif chunk_id == b"data":
+                if fmt is None:
+                    return None
+                offset = position + 8
+                # Los WAV escritos en streaming pueden declarar tamaño 0 o 0xFFFFFFFF: se lee hasta el final.
+                size = file_size - offset if chunk_size in (0, 0xFFFFFFFF) else min(chunk_size, file_size - offset)
+                return fmt + (offset, size)
+            # Los chunks de tamaño impar llevan un byte de relleno.
+            position += 8 + chunk_size + chunk_size % 2
+        return None
+    finally:
+        source.seek(0)
+
+
+def sniff_pcm_wav(source, channels=1):
+    """Lee la cabecera RIFF/WAV de 'source'.
+
+    Si el audio ya está en el formato de Vosk (PCM s16le, 16 kHz; mono salvo que se pida
+    otro número de canales) devuelve (posición, tamaño) de los datos de audio; si no (otro
+    formato, otro contenedor o un WAV que no se entiende), devuelve None.
+    """
+    header = _read_wav_header(source)
+    if header is None:
+        return None
+    tag, wav_channels, rate, bits, offset, size = header
+    if (tag, wav_channels, rate, bits) != (WAVE_FORMAT_PCM, channels, PCM_SAMPLE_RATE, 16):
+        return None
+    return offset, size - size % (PCM_SAMPLE_WIDTH * channels)
+
+
+@contextlib.contextmanager
+def pcm_view(source, offset, size):
+    """Vista (memoryview) sobre los datos de audio del archivo subido, sin copiarlos.
+
+    Si el archivo está en memoria (BytesIO, o SpooledTemporaryFile aún sin pasar a disco) se usa
+    su buffer; si está en disco, un mmap de solo lectura.
+    """
+    # SpooledTemporaryFile guarda los archivos pequeños en un BytesIO interno ('_file').
+    raw = getattr(source, "_file", source)
+    if hasattr(raw, "getbuffer"):
+        buffer = raw.getbuffer()
+        try:
+            with buffer[offset:offset + size] as view:
+                yield view
+        finally:
+            buffer.release()
+        return
+    with mmap.mmap(raw.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+        buffer = memoryview(mapped)
+        try:
+            with buffer[offset:offset + size] as view:
+                yield view
+        finally:
+            buffer.release()
+
+
+async def upload_pcm_chunks(source, chunk_size=PCM_CHUNK_SIZE, channels=1):
+    """Produce el PCM (16 kHz, mono por defecto) de un archivo subido en bloques de tamaño fijo.
+
+    Los WAV que ya están en el formato de Vosk se leen directamente (sin FFmpeg);
+    el resto de formatos se convierten con 'ffmpeg_pcm_chunks'. Con 'channels' > 1 los
+    canales se mantienen separados (intercalados) y cada bloque lleva 'chunk_size' bytes
+    por canal.
+    """
+    chunk_size *= channels
+    wav = sniff_pcm_wav(source, channels)
+    if wav is None:
+        metrics.UPLOAD_DECODE_PATH.labels("ffmpeg").inc()
+        async for chunk in ffmpeg_pcm_chunks(source, chunk_size, channels=channels):
+            yield chunk
+        return
+    metrics.UPLOAD_DECODE_PATH.labels("wav").inc()
+    with pcm_view(source, *wav) as view:
+        for offset in range(0, len(view), chunk_size):
+            # Vosk necesita 'bytes': es la única copia de los datos en todo el camino.
+            yield bytes(view[offset:offset + chunk_size])
+
+
+async def _run_ffprobe(source, fd=None):
+    # Pregunta a ffprobe los canales del primer stream de audio. Igual que en '_run_ffmpeg',
+    # sin 'fd' el archivo se envía por stdin y con 'fd' ffprobe lo abre como archivo normal.
+    process = await asyncio.create_subprocess_exec(
+        "ffprobe", "-v", "error", "-select_streams", "a:0",
+        "-show_entries", "stream=channels", "-of", "csv=p=0",
+        "pipe:0" if fd is None else f"/dev/fd/{fd}",
+        stdin=asyncio.subprocess.PIPE if fd is None else asyncio.subprocess.DEVNULL,
+        stdout=asyncio.subprocess.PIPE,
+        stderr=asyncio.subprocess.PIPE,
+        pass_fds=() if fd is None else (fd,),
+    )
+    feeder = asyncio.create_task(_feed_ffmpeg(process.stdin, source)) if fd is None else None
+    try:
+        # No usamos 'communicate': cerraría stdin mientras '_feed_ffmpeg' aún escribe.
+        stdout, stderr = await asyncio.gather(process.stdout.read(), process.stderr.read())
+        if feeder is not None:
+            await feeder
+        await process.wait()
+    finally:
+        if feeder is not None:
+            feeder.cancel()
+        if process.returncode is None:
+            process.kill()
+            await process.wait()
+        # ffprobe no siempre lee todo el archivo: volvemos al principio para la conversión.
+        source.seek(0)
+    try:
+        return int(stdout.split()[0])
+    except (IndexError, ValueError):
+        raise ConversionError(stderr.decode(errors="replace") or "No audio stream found.")
+
+
+async def probe_channels(source):
+    """Devuelve el número de canales de audio de un archivo subido.
+
+    Se lee de la cabecera si es un WAV; para el resto de formatos se pregunta a ffprobe
+    (como en 'ffmpeg_pcm_chunks', primero por pipe y, si falla, con el archivo).
+    Lanza ConversionError si no se puede averiguar.
+    """
+    header = _read_wav_header(source)
+    if header is not None and header[0] == WAVE_FORMAT_PCM:
+        return header[1]
+    try:
+        return await _run_ffprobe(source)
+    except ConversionError:
+        pass
+    loop = asyncio.get_running_loop()
+    fd, copy = await loop.run_in_executor(None, _seekable_file, source)
+    try:
+        return await _run_ffprobe(source, fd)
+    finally:
+        if copy is not None:
+            copy.close()
+        source.seek(0)
+
+
+def find_silence_cuts(pcm, sample_rate=PCM_SAMPLE_RATE, min_silence_ms=SILENCE_MIN_MS,
+                      min_segment_seconds=SEGMENT_MIN_SECONDS):
+    """Busca puntos de corte (en muestras) en los silencios de un audio PCM s16le mono."""
+    samples = np.frombuffer(pcm, dtype="<i2", count=len(pcm) // PCM_SAMPLE_WIDTH)
+    frame = sample_rate * SILENCE_FRAME_MS // 1000
+    n_frames = len(samples) // frame
+    if n_frames == 0:
+        return []
+
+    # Energía RMS de cada frame, calculada de forma vectorizada por bloques de frames: así solo
+    # el array de energías (un valor por frame) crece con la duración del archivo.
+    energy = np.empty(n_frames, dtype=np.float64)
+    block = max(1, SILENCE_BLOCK_SECONDS * 1000 // SILENCE_FRAME_MS)
+    for first in range(0, n_frames, block):
+        last = min(first + block, n_frames)
+        frames = samples[first * frame:last * frame].reshape(last - first, frame).astype(np.int64)
+        energy[first:last] = np.einsum("ij,ij->i", frames, frames)
+    energy = np.sqrt(energy / frame)
+    # El umbral es relativo al nivel de voz del archivo (percentil 95) para tolerar distintos volúmenes.
+    threshold = max(SILENCE_MIN_RMS, 0.1 * float(np.percentile(energy, 95)))
+    silent = energy < threshold
+
+    # Localizamos los tramos de frames silenciosos consecutivos (inicio y fin de cada tramo).
+    edges = np.diff(np.concatenate(([0], silent.view(np.int8), [0])))
+    starts = np.flatnonzero(edges == 1)
+    ends = np.flatnonzero(edges == -1)
+    long_enough = (ends - starts) >= max(1, min_silence_ms // SILENCE_FRAME_MS)
+    # Cortamos en la mitad de cada silencio suficientemente largo.
+    candidates = ((starts[long_enough] + ends[long_enough]) // 2) * frame
+
+    # Nos quedamos con los cortes que dejan segmentos de al menos 'min_segment_seconds'.
+    cuts = []
+    last = 0
+    min_segment = int(min_segment_seconds * sample_rate)
+    for cut in candidates.tolist():
+        if cut - last >= min_segment and len(samples) - cut >= min_segment:
+            cuts.append(cut)
+            last = cut
+    return cuts
+
+
+def segment_bounds(n_samples, cuts):
+    """Convierte puntos de corte en una lista de segmentos (inicio, fin) en muestras."""
+    points = [0] + list(cuts) + [n_samples]
+    return list(zip(points[:-1], points[1:]))
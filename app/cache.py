@@ -0,0 +1,130 @@
+import collections
+import hashlib
+import json
+import os
+import tempfile
+import threading
+
+# Caché de resultados de /transcribe direccionada por contenido.
+# La clave es el hash SHA-256 de los bytes subidos junto con la identidad del modelo y las
+# opciones de reconocimiento, así que reenviar el mismo archivo devuelve el resultado
+# guardado sin ejecutar FFmpeg ni Vosk.
+# Tiene dos niveles: uno en memoria (LRU limitado por tamaño) y otro opcional en disco
+# que sobrevive a los reinicios del servidor.
+
+# Tamaño máximo del nivel en memoria (bytes de resultados serializados).
+CACHE_MAX_BYTES = int(os.environ.get("CACHE_MAX_BYTES", 64 * 1024 * 1024))
+# Carpeta del nivel en disco. Si está vacía, solo se usa la memoria.
+CACHE_DIR = os.environ.get("CACHE_DIR", "")
+
+# Tamaño de cada lectura al calcular el hash del archivo subido.
+HASH_READ_SIZE = 1024 * 1024
+
+# Variable global con la caché compartida (se crea una sola vez al iniciar la aplicación).
+TRANSCRIPTION_CACHE = None
+
+
+def cache_key(source, model_id, options):
+    """Calcula la clave de un archivo subido. Deja el archivo de nuevo al principio."""
+    digest = hashlib.sha256()
+    digest.update(f"{model_id}|{json.dumps(options, sort_keys=True)}|".encode())
+    while True:
+        block = source.read(HASH_READ_SIZE)
+        if not block:
+            break
+        digest.update(block)
+    source.seek(0)
+    return digest.hexdigest()
+
+
+class TranscriptionCache:
+    """Caché LRU en memoria con un nivel opcional en disco."""
+
+    def __init__(self, max_bytes=CACHE_MAX_BYTES, directory=CACHE_DIR):
+        self.max_bytes = max_bytes
+        self.directory = directory or None
+        if self.directory:
+            os.makedirs(self.directory, exist_ok=True)
+        # Guardamos los resultados ya serializados: así su tamaño en memoria es conocido.
+        self._entries = collections.OrderedDict()
+        self._lock = threading.Lock()
+        self.size = 0
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def _path(self, key):
+        return os.path.join(self.directory, key[:2], key + ".json")
+
+    def _remember(self, key, payload):
+        # Inserta en el nivel de memoria y expulsa las entradas menos usadas si no caben.
+        if len(payload) > self.max_bytes:
+            return
+        with self._lock:
+            if key in self._entries:
+                self.size -= len(self._entries.pop(key))
+            self._entries[key] = payload
+            self.size += len(payload)
+            while self.size > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self.size -= len(evicted)
+                self.evictions += 1
+
+    def get(self, key):
+        """Devuelve el resultado guardado para 'key' o None."""
+        with self._lock:
+            payload = self._entries.get(key)
+            if payload is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return json.loads(payload)
+
+        if self.directory:
+            try:
+                with open(self._path(key), "rb") as f:
+                    payload = f.read()
+            except FileNotFoundError:
+                pass
+            else:
+                # Lo subimos al nivel de memoria para las siguientes peticiones.
+                self._remember(key, payload)
+                with self._lock:
+                    self.hits += 1
+                    self.disk_hits += 1
+                return json.loads(payload)
+
+        with self._lock:
+            self.misses += 1
+        return None
+
+    def put(self, key, result):
+        """Guarda un resultado en memoria y, si está activado, en disco."""
+        payload = json.dumps(result, ensure_ascii=False).encode()
+        self._remember(key, payload)
+        if self.directory:
+            path = self._path(key)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            # Escribimos en un archivo temporal y lo renombramos para que nunca se lea a medias.
+            with tempfile.NamedTemporaryFile(dir=os.path.dirname(path), delete=False) as f:
+                f.write(payload)
+            os.replace(f.name, path)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "bytes": self.size,
+                "max_bytes": self.max_bytes,
+                "disk": self.directory is not None,
+                "hits": self.hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+            }
+
+
+def create_transcription_cache():
+    """Crea la caché de resultados compartida."""
+    global TRANSCRIPTION_CACHE
+    TRANSCRIPTION_CACHE = TranscriptionCache()
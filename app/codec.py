@@ -0,0 +1,110 @@
+import numpy as np
+
+# 'opuslib' es opcional: solo se necesita si el cliente envía audio Opus.
+# Además de la librería de Python hace falta libopus en el sistema; si no la encuentra,
+# opuslib lanza una excepción genérica al importarse.
+try:
+    import opuslib
+except Exception:
+    opuslib = None
+
+# Decodificación de audio comprimido en /ws/transcribe.
+# El cliente puede enviar, en lugar de PCM s16le (256 kbit/s a 16 kHz), audio G.711
+# (µ-law o A-law, 1 byte por muestra) u Opus. Cada bloque se decodifica aquí, en memoria,
+# a PCM s16le antes de las demás etapas (remuestreo, VAD y Vosk), sin pasar por FFmpeg.
+
+CODECS = ["pcm_s16le", "mulaw", "alaw", "opus"]
+# Frecuencias que admite Opus.
+OPUS_SAMPLE_RATES = [8000, 12000, 16000, 24000, 48000]
+# Duración máxima de un paquete Opus (ms).
+OPUS_MAX_FRAME_MS = 120
+
+
+def _mulaw_table():
+    # Tabla de las 256 muestras µ-law (G.711) a PCM lineal de 16 bits.
+    u = ~np.arange(256, dtype=np.uint8)
+    exponent = (u >> 4) & 0x07
+    mantissa = (u & 0x0F).astype(np.int32)
+    magnitude = (((mantissa << 3) + 0x84) << exponent) - 0x84
+    return np.where(u & 0x80, -magnitude, magnitude).astype("<i2")
+
+
+def _alaw_table():
+    # Tabla de las 256 muestras A-law (G.711) a PCM lineal de 16 bits.
+    a = np.arange(256, dtype=np.uint8) ^ 0x55
+    exponent = ((a >> 4) & 0x07).astype(np.int32)
+    mantissa = (a & 0x0F).astype(np.int32)
+    magnitude = np.where(
+        exponent == 0,
+        (mantissa << 4) + 8,
+        ((mantissa << 4) + 0x108) << np.maximum(exponent - 1, 0),
+    )
+    return np.where(a & 0x80, magnitude, -magnitude).astype("<i2")
+
+
+G711_TABLES = {"mulaw": _mulaw_table(), "alaw": _alaw_table()}
+
+
+class PcmCodec:
+    """PCM s16le sin comprimir: el audio pasa tal cual."""
+
+    name = "pcm_s16le"
+
+    def __init__(self, sample_rate, channels):
+        self.sample_rate = sample_rate
+        self.channels = channels
+
+    def decode(self, chunk):
+        return chunk
+
+
+class G711Codec:
+    """G.711 µ-law o A-law: cada byte se convierte en una muestra de 16 bits con una tabla."""
+
+    def __init__(self, name, sample_rate, channels):
+        self.name = name
+        self.sample_rate = sample_rate
+        self.channels = channels
+        self._table = G711_TABLES[name]
+
+    def decode(self, chunk):
+        # Una sola operación vectorizada por bloque: indexar la tabla con los bytes recibidos.
+        return self._table[np.frombuffer(chunk, dtype=np.uint8)].tobytes()
+
+
+class OpusCodec:
+    """Opus: cada mensaje binario del WebSocket es un paquete Opus completo.
+
+    Opus puede decodificar directamente a cualquier frecuencia y número de canales, así que
+    se decodifica ya a 16 kHz mono y no hace falta remuestrear.
+    """
+
+    name = "opus"
+
+    def __init__(self, sample_rate=16000, channels=1):
+        self.sample_rate = sample_rate
+        self.channels = channels
+        self._decoder = opuslib.Decoder(sample_rate, channels)
+        self._max_frame = sample_rate * OPUS_MAX_FRAME_MS // 1000
+
+    def decode(self, packet):
+        return self._decoder.decode(bytes(packet), self._max_frame)
+
+
+def codec_from_handshake(value, sample_rate, channels, output_rate=16000):
+    """Crea el decodificador pedido en el campo 'codec' del handshake.
+
+    Lanza ValueError si el codec no existe o no se puede usar con ese formato.
+    """
+    name = value or "pcm_s16le"
+    if name not in CODECS:
+        raise ValueError(f"Unsupported codec. Supported codecs are: {CODECS}")
+    if name == "pcm_s16le":
+        return PcmCodec(sample_rate, channels)
+    if name in G711_TABLES:
+        return G711Codec(name, sample_rate, channels)
+    if opuslib is None:
+        raise ValueError("Opus is not available on this server.")
+    if sample_rate not in OPUS_SAMPLE_RATES:
+        raise ValueError(f"Unsupported sample rate for Opus. Supported rates are: {OPUS_SAMPLE_RATES}")
+    return OpusCodec(output_rate, 1)
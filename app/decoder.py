@@ -0,0 +1,121 @@
+import asyncio
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from . import metrics
+
+# Este módulo contiene el "ejecutor de decodificación": un pool de hilos donde se
+# ejecutan TODAS las llamadas a Kaldi (AcceptWaveform, Result, FinalResult...).
+# Así el event loop de FastAPI nunca se bloquea esperando a Vosk y un archivo largo
+# en /transcribe no congela los streams de /ws/transcribe del mismo worker.
+
+# Número de hilos de decodificación y cantidad máxima de tareas en cola.
+# Se pueden ajustar con variables de entorno al arrancar el servidor.
+DECODE_WORKERS = int(os.environ.get("DECODE_WORKERS", os.cpu_count() or 1))
+DECODE_MAX_PENDING = int(os.environ.get("DECODE_MAX_PENDING", DECODE_WORKERS * 4))
+
+# Variable global con el ejecutor compartido (igual que RECOGNIZER_POOL en 'services').
+# Se crea una sola vez al iniciar la aplicación.
+DECODE_EXECUTOR = None
+
+
+class DecodeExecutor:
+    """Pool de hilos acotado que ejecuta las llamadas a Kaldi fuera del event loop."""
+
+    def __init__(self, workers=DECODE_WORKERS, max_pending=DECODE_MAX_PENDING):
+        self.workers = workers
+        self.max_pending = max_pending
+        self._pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="decode")
+        # El semáforo limita cuántas tareas pueden estar en cola o ejecutándose a la vez.
+        # Si la cola está llena, quien llama espera (backpressure) en lugar de acumular memoria.
+        self._slots = asyncio.Semaphore(max_pending)
+        self._stats_lock = threading.Lock()
+        self.pending = 0
+        self.completed = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+        self.wait_last = 0.0
+
+    def lane(self):
+        """Crea un carril que mantiene en orden las llamadas de un mismo reconocedor."""
+        return DecodeLane(self)
+
+    async def run(self, fn, *args):
+        """Ejecuta 'fn(*args)' en el pool y devuelve su resultado."""
+        submitted = time.perf_counter()
+        self.pending += 1
+        try:
+            async with self._slots:
+                loop = asyncio.get_running_loop()
+                return await loop.run_in_executor(self._pool, self._call, submitted, fn, args)
+        finally:
+            self.pending -= 1
+
+    def _call(self, submitted, fn, args):
+        # Medimos el tiempo que la tarea pasó en cola antes de empezar a ejecutarse.
+        waited = time.perf_counter() - submitted
+        with self._stats_lock:
+            self.completed += 1
+            self.wait_total += waited
+            self.wait_last = waited
+            self.wait_max = max(self.wait_max, waited)
+        metrics.QUEUE_WAIT_SECONDS.observe(waited)
+        return fn(*args)
+
+    @property
+    def saturated(self):
+        """True si la cola está llena: la decodificación va por detrás de lo que llega."""
+        return self.pending >= self.max_pending
+
+    def stats(self):
+        """Devuelve un resumen del estado de la cola y del tiempo de espera."""
+        with self._stats_lock:
+            average = self.wait_total / self.completed if self.completed else 0.0
+            return {
+                "workers": self.workers,
+                "max_pending": self.max_pending,
+                "pending": self.pending,
+                "completed": self.completed,
+                "queue_wait_avg": average,
+                "queue_wait_max": self.wait_max,
+                "queue_wait_last": self.wait_last,
+            }
+
+    def shutdown(self):
+        self._pool.shutdown(wait=True)
+
+
+class DecodeLane:
+    """Serializa las llamadas de un reconocedor: nunca hay dos a la vez y se respetan en orden."""
+
+    def __init__(self, executor):
+        self._executor = executor
+        # El lock de asyncio garantiza el orden (FIFO) de envío al pool.
+        self._order = asyncio.Lock()
+        # El lock de hilos garantiza que, aunque una tarea se cancele desde asyncio mientras
+        # se ejecuta, la siguiente no toque el reconocedor hasta que la anterior termine.
+        self._busy = threading.Lock()
+
+    async def run(self, fn, *args):
+        async with self._order:
+            return await self._executor.run(self._call, fn, args)
+
+    def _call(self, fn, args):
+        with self._busy:
+            return fn(*args)
+
+
+def start_decode_executor():
+    """Crea el ejecutor de decodificación compartido."""
+    global DECODE_EXECUTOR
+    DECODE_EXECUTOR = DecodeExecutor()
+    print(f"Ejecutor de decodificación iniciado con {DECODE_EXECUTOR.workers} hilos.")
+
+
+def shutdown_decode_executor():
+    """Detiene el ejecutor esperando a que terminen las tareas en curso."""
+    global DECODE_EXECUTOR
+    if DECODE_EXECUTOR is not None:
+        DECODE_EXECUTOR.shutdown()
+        DECODE_EXECUTOR = None
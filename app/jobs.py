@@ -0,0 +1,214 @@
+import asyncio
+import collections
+import os
+import time
+import uuid
+from . import audio
+from . import transcription
+
+# Trabajos de transcripción asíncronos (POST /jobs).
+# El cliente sube uno o varios archivos, recibe un ID por cada uno y consulta su estado
+# más tarde, sin mantener la conexión HTTP abierta durante toda la conversión.
+# Un planificador interno ejecuta los trabajos por prioridad, reparte el turno entre
+# clientes (round-robin) y limita cuántos se ejecutan a la vez según los núcleos disponibles.
+
+# Número máximo de trabajos ejecutándose a la vez.
+JOBS_MAX_CONCURRENT = int(os.environ.get("JOBS_MAX_CONCURRENT", os.cpu_count() or 1))
+# Cuántos trabajos terminados se conservan en memoria para poder consultarlos.
+JOBS_MAX_FINISHED = int(os.environ.get("JOBS_MAX_FINISHED", 1000))
+
+# Prioridad: un número entre 0 y 9; los valores más altos se ejecutan antes.
+MIN_PRIORITY = 0
+MAX_PRIORITY = 9
+DEFAULT_PRIORITY = 5
+
+FINISHED_STATES = ("done", "failed", "cancelled")
+
+# Variable global con el planificador (se crea una sola vez al iniciar la aplicación).
+JOB_SCHEDULER = None
+
+
+class Job:
+    """Un archivo pendiente de transcribir y su estado."""
+
+    def __init__(self, path, filename, client, priority, parallel):
+        self.id = uuid.uuid4().hex
+        self.path = path
+        self.filename = filename
+        self.client = client
+        self.priority = priority
+        self.parallel = parallel
+        self.status = "queued"
+        self.result = None
+        self.error = None
+        self.created_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+        self.task = None
+        # Se notifica cada vez que cambia el estado (para GET /jobs/{id}/events).
+        self.changed = asyncio.Condition()
+
+    async def set_status(self, status, result=None, error=None):
+        self.status = status
+        self.result = result
+        self.error = error
+        if status == "running":
+            self.started_at = time.time()
+        elif status in FINISHED_STATES:
+            self.finished_at = time.time()
+        async with self.changed:
+            self.changed.notify_all()
+
+    def to_dict(self):
+        return {
+            "id": self.id,
+            "filename": self.filename,
+            "client": self.client,
+            "priority": self.priority,
+            "status": self.status,
+            "result": self.result,
+            "error": self.error,
+            "created_at": self.created_at,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+        }
+
+
+class JobScheduler:
+    """Cola de trabajos por prioridad, con turnos entre clientes y concurrencia limitada."""
+
+    def __init__(self, max_concurrent=JOBS_MAX_CONCURRENT, max_finished=JOBS_MAX_FINISHED):
+        self.max_concurrent = max_concurrent
+        self.max_finished = max_finished
+        self.jobs = {}
+        # Para cada prioridad, una cola por cliente. El orden del OrderedDict define el turno:
+        # el cliente que acaba de ejecutar un trabajo pasa al final.
+        self._queues = collections.defaultdict(collections.OrderedDict)
+        self._finished = collections.deque()
+        self._wakeup = asyncio.Condition()
+        self._workers = []
+        self.running = 0
+
+    def start(self):
+        self._workers = [asyncio.ensure_future(self._worker()) for _ in range(self.max_concurrent)]
+
+    async def stop(self):
+        running = [job.task for job in self.jobs.values() if job.task is not None and not job.task.done()]
+        for task in running + self._workers:
+            task.cancel()
+        await asyncio.gather(*running, *self._workers, return_exceptions=True)
+        # Los trabajos que no llegaron a terminar no se van a ejecutar: liberamos sus archivos.
+        for job in self.jobs.values():
+            self._remove_file(job)
+
+    @property
+    def queued(self):
+        return sum(len(queue) for clients in self._queues.values() for queue in clients.values())
+
+    async def submit(self, job):
+        """Añade un trabajo a la cola."""
+        self.jobs[job.id] = job
+        self._queues[job.priority].setdefault(job.client, collections.deque()).append(job)
+        async with self._wakeup:
+            self._wakeup.notify()
+        return job
+
+    def _next_job(self):
+        # Prioridad más alta primero; dentro de ella, el primer cliente en turno.
+        for priority in sorted(self._queues, reverse=True):
+            clients = self._queues[priority]
+            if not clients:
+                continue
+            client, queue = next(iter(clients.items()))
+            job = queue.popleft()
+            if queue:
+                clients.move_to_end(client)
+            else:
+                del clients[client]
+            return job
+        return None
+
+    async def _worker(self):
+        while True:
+            async with self._wakeup:
+                job = self._next_job()
+                while job is None:
+                    await self._wakeup.wait()
+                    job = self._next_job()
+            self.running += 1
+            try:
+                await job.set_status("running")
+                # Cada trabajo se ejecuta en su propia tarea para poder cancelarlo sin detener el worker.
+                job.task = asyncio.ensure_future(self._execute(job))
+                await asyncio.wait([job.task])
+                if job.status not in FINISHED_STATES:
+                    # La tarea se canceló antes de empezar a ejecutarse.
+                    await job.set_status("cancelled")
+            finally:
+                self.running -= 1
+                self._finish(job)
+
+    async def _execute(self, job):
+        try:
+            with open(job.path, "rb") as source:
+                result = await transcription.transcribe(source, parallel=job.parallel)
+        except asyncio.CancelledError:
+            await job.set_status("cancelled")
+            raise
+        except audio.ConversionError as e:
+            await job.set_status("failed", error={"error": "Failed to convert audio file", "details": e.details})
+        except Exception as e:
+            await job.set_status("failed", error={"error": "Transcription failed", "details": str(e)})
+        else:
+            await job.set_status("done", result=result)
+
+    def _remove_file(self, job):
+        if job.path and os.path.exists(job.path):
+            os.remove(job.path)
+        job.path = None
+
+    def _finish(self, job):
+        # Limpieza al terminar: borramos el archivo y olvidamos los trabajos terminados más antiguos.
+        self._remove_file(job)
+        self._finished.append(job.id)
+        while len(self._finished) > self.max_finished:
+            self.jobs.pop(self._finished.popleft(), None)
+
+    async def cancel(self, job):
+        """Cancela un trabajo en cola o en ejecución."""
+        if job.status == "queued":
+            queue = self._queues[job.priority].get(job.client)
+            if queue is not None and job in queue:
+                queue.remove(job)
+                if not queue:
+                    del self._queues[job.priority][job.client]
+            await job.set_status("cancelled")
+            self._finish(job)
+        elif job.status == "running" and job.task is not None:
+            job.task.cancel()
+            # Esperamos a que la cancelación termine (FFmpeg detenido y estado actualizado).
+            await asyncio.wait([job.task])
+        return job
+
+    def stats(self):
+        return {
+            "max_concurrent": self.max_concurrent,
+            "running": self.running,
+            "queued": self.queued,
+        }
+
+
+def start_job_scheduler():
+    """Crea el planificador de trabajos y arranca sus workers."""
+    global JOB_SCHEDULER
+    JOB_SCHEDULER = JobScheduler()
+    JOB_SCHEDULER.start()
+    print(f"Planificador de trabajos iniciado ({JOB_SCHEDULER.max_concurrent} a la vez).")
+
+
+async def stop_job_scheduler():
+    """Detiene el planificador de trabajos."""
+    global JOB_SCHEDULER
+    if JOB_SCHEDULER is not None:
+        await JOB_SCHEDULER.stop()
+        JOB_SCHEDULER = None
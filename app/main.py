@@ -1,26 +1,65 @@
-from fastapi import FastAPI, WebSocket, WebSocketDisconnect, UploadFile, File
+from fastapi import FastAPI, WebSocket, WebSocketDisconnect, UploadFile, File, Request, Header, HTTPException
+from fastapi.responses import StreamingResponse, PlainTextResponse, JSONResponse
+from typing import List, Optional
+from starlette.websockets import WebSocketState
 from contextlib import asynccontextmanager
 from . import services
+from . import models
+from . import workers
+from . import decoder
+from . import audio
+from . import transcription
+from . import streaming
+from . import vad
+from . import codec
+from . import resample
+from . import cache
+from . import jobs
+from . import admission
+from . import metrics
+from . import sessions
+import asyncio
 import json
-import subprocess
-import tempfile
-import shutil
 import os
+import shutil
+import tempfile
 
-# Importamos las librerías necesarias de FastAPI, WebSocket, y las herramientas de Python
-# para manejar archivos temporales, procesos externos (FFmpeg) y la lógica de Vosk.
+# Importamos las librerías necesarias de FastAPI, WebSocket, y los módulos de la aplicación
+# para la conversión de audio (FFmpeg), la decodificación y la lógica de Vosk.
 
 # Context manager 'lifespan' para manejar el inicio y apagado de la aplicación.
-# Se asegura de que el modelo de Vosk se cargue una sola vez al inicio del servidor.
+# Los modelos de Vosk se cargan una sola vez, en segundo plano, sin bloquear el arranque.
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     # --- Código que se ejecuta al iniciar ---
-    print("Cargando modelo de Vosk para la aplicación...")
-    # Llamamos a la función que carga el modelo de Vosk (definida en 'services').
-    services.load_vosk_model()
-    print("Modelo de Vosk cargado exitosamente.")
+    # Registro de modelos: busca las carpetas de modelos, pero todavía no carga ninguno.
+    models.create_model_registry()
+    # Si está configurado, creamos los procesos de decodificación (fork) que comparten el modelo.
+    # Necesitan el modelo por defecto ya cargado y deben crearse antes de arrancar los hilos del ejecutor.
+    if workers.DECODE_PROCESSES > 0:
+        workers.start_worker_pool(models.MODEL_REGISTRY.load_now().model)
+    # Iniciamos el pool de hilos donde se ejecutan todas las llamadas a Kaldi.
+    decoder.start_decode_executor()
+    # Pool de reconocedores reutilizables.
+    services.create_recognizer_pool()
+    # Cargamos en segundo plano los modelos de PRELOAD_MODELS y precalentamos el pool con ellos.
+    models.MODEL_REGISTRY.preload(models.PRELOAD_MODELS, on_loaded=services.prewarm_recognizers)
+    # Caché de resultados de /transcribe (memoria y, opcionalmente, disco).
+    cache.create_transcription_cache()
+    # Límites de streams y archivos simultáneos.
+    admission.create_admission_controller()
+    # Planificador de trabajos de transcripción asíncronos (/jobs).
+    jobs.start_job_scheduler()
+    # Sesiones de /ws/transcribe cortadas que se pueden reanudar.
+    sessions.create_session_table()
     yield # Aquí el servidor está listo para recibir peticiones.
-    # --- Código que se ejecuta al apagar (si fuera necesario) ---
+    # --- Código que se ejecuta al apagar ---
+    await jobs.stop_job_scheduler()
+    sessions.close_session_table()
+    await models.stop_model_registry()
+    await services.stop_recognizer_pool()
+    decoder.shutdown_decode_executor()
+    workers.stop_worker_pool()
     print("Aplicación finalizada.")
 
 # Creamos la instancia principal de la aplicación FastAPI, usando el gestor de ciclo de vida.
@@ -31,66 +70,282 @@ app = FastAPI(lifespan=lifespan)
 async def root():
     return {"message": "Servidor de transcripción funcionando"}
 
+# Disponibilidad (GET /ready): 200 cuando el modelo por defecto está cargado, 503 mientras se carga.
+# Pensado para los "readiness probes" de Docker/Kubernetes y los balanceadores.
+@app.get("/ready")
+async def ready():
+    registry = models.MODEL_REGISTRY
+    body = {
+        "ready": registry.ready,
+        "default_model": registry.default,
+        "models": {name: entry.state for name, entry in registry.entries.items()},
+    }
+    return JSONResponse(body, status_code=200 if registry.ready else 503)
+
+# Estadísticas internas (GET /stats): cola de decodificación y coste del remuestreo.
+@app.get("/stats")
+async def stats():
+    return {
+        "decoder": decoder.DECODE_EXECUTOR.stats(),
+        "resampler": resample.stats(),
+        "cache": cache.TRANSCRIPTION_CACHE.stats(),
+        "jobs": jobs.JOB_SCHEDULER.stats(),
+        "admission": admission.ADMISSION.stats(),
+        "recognizers": services.RECOGNIZER_POOL.stats(),
+        "models": models.MODEL_REGISTRY.stats(),
+        "sessions": sessions.SESSION_TABLE.stats(),
+    }
+
+# Métricas para Prometheus (GET /metrics). Los gauges se leen en el momento de la consulta.
+metrics.Gauge("transcription_active_streams", "Active WebSocket streams", lambda: admission.ADMISSION.streams)
+metrics.Gauge("transcription_active_file_jobs", "In-flight /transcribe requests", lambda: admission.ADMISSION.file_jobs)
+metrics.Gauge("transcription_jobs_running", "Running /jobs transcriptions", lambda: jobs.JOB_SCHEDULER.running)
+metrics.Gauge("transcription_jobs_queued", "Queued /jobs transcriptions", lambda: jobs.JOB_SCHEDULER.queued)
+metrics.Gauge("transcription_decode_pending", "Calls queued or running in the decode executor",
+              lambda: decoder.DECODE_EXECUTOR.pending)
+metrics.Gauge("transcription_models_resident_bytes", "Estimated size of the loaded models",
+              lambda: models.MODEL_REGISTRY.resident_bytes)
+metrics.Gauge("transcription_parked_sessions", "Disconnected streams waiting to be resumed",
+              lambda: len(sessions.SESSION_TABLE))
+metrics.Gauge("transcription_recognizers_idle", "Idle recognizers in the pool", lambda: services.RECOGNIZER_POOL.idle)
+
+class _CountResponseBytes:
+    # Cuenta en BYTES("http", "out") el cuerpo de las respuestas HTTP: JSON, NDJSON y SSE.
+    # Es un middleware ASGI puro para que las respuestas incrementales se cuenten a medida que
+    # salen. Las de /metrics no se cuentan: no son tráfico de transcripción.
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["path"] == "/metrics":
+            await self.app(scope, receive, send)
+            return
+
+        async def counting_send(message):
+            await send(message)
+            if message["type"] == "http.response.body":
+                metrics.BYTES.labels("http", "out").inc(len(message.get("body", b"")))
+
+        await self.app(scope, receive, counting_send)
+
+app.add_middleware(_CountResponseBytes)
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def prometheus_metrics():
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
+
+def _upload_size(upload):
+    # Tamaño del archivo subido (ya está guardado por Starlette en memoria o en disco).
+    upload.file.seek(0, os.SEEK_END)
+    size = upload.file.tell()
+    upload.file.seek(0)
+    return size
+
 # ----------------------------------------------------------------------
 ## Endpoint REST para Transcripción de Archivos (/transcribe)
 # ----------------------------------------------------------------------
 
-@app.post("/transcribe")
-async def transcribe_file(file: UploadFile = File(...)):
-    # 1. GUARDAR ARCHIVO TEMPORALMENTE
-    # Creamos un archivo temporal para guardar el archivo subido por el usuario.
-    with tempfile.NamedTemporaryFile(delete=False, suffix=os.path.splitext(file.filename)[1]) as temp_input_file:
-        # Copiamos el contenido del archivo subido al archivo temporal.
-        shutil.copyfileobj(file.file, temp_input_file)
-        temp_input_path = temp_input_file.name
-    
-    # Definimos la ruta para el archivo de salida en formato PCM (raw audio).
-    temp_output_path = temp_input_path + ".pcm"
+# Formatos de la respuesta incremental de /transcribe ('?stream=').
+STREAM_FORMATS = ["ndjson", "sse"]
+
+def _format_event(message, stream):
+    # Una línea JSON (NDJSON) o un evento SSE con el tipo de mensaje como nombre del evento.
+    data = json.dumps(message, ensure_ascii=False)
+    if stream == "sse":
+        return f"event: {message['type']}\ndata: {data}\n\n"
+    return data + "\n"
+
+async def _streamed_transcription(source, model, stream):
+    # Envía cada segmento en cuanto está listo. La respuesta ya empezó, así que los errores
+    # se envían como un último mensaje 'error' en lugar de un código HTTP.
+    messages = transcription.stream_segments(source, model)
+    try:
+        async for message in messages:
+            yield _format_event(message, stream)
+    except audio.ConversionError as e:
+        yield _format_event({"type": "error", "error": "Failed to convert audio file", "details": e.details}, stream)
+    except models.ModelLoadError as e:
+        yield _format_event({"type": "error", "error": str(e)}, stream)
+    finally:
+        await messages.aclose()
+
+class _FileJobStreamingResponse(StreamingResponse):
+    # Respuesta incremental que libera el hueco de MAX_FILE_JOBS al terminar, pase lo que pase.
+    # No basta con un 'finally' en el generador: si el cliente se desconecta antes de la primera
+    # iteración, Starlette nunca lo arranca y ese 'finally' no se ejecuta.
+    async def __call__(self, scope, receive, send):
+        try:
+            await super().__call__(scope, receive, send)
+        finally:
+            admission.ADMISSION.release_file_job()
+            # Si el cliente se fue a mitad, el generador queda parado en un 'yield': lo cerramos
+            # para que devuelva ya el reconocedor y el modelo en lugar de esperar al recolector.
+            await self.body_iterator.aclose()
 
+@app.post("/transcribe")
+async def transcribe_file(
+    file: UploadFile = File(...),
+    parallel: bool = False,
+    model: Optional[str] = None,
+    stream: Optional[str] = None,
+    multichannel: bool = False,
+):
+    # Modelo elegido con '?model=' (por defecto, el modelo por defecto del registro).
+    try:
+        models.MODEL_REGISTRY.get(model)
+    except models.ModelNotFound as e:
+        raise HTTPException(status_code=422, detail=str(e))
+    # Respuesta incremental opcional: '?stream=ndjson' o '?stream=sse'.
+    if stream is not None and stream not in STREAM_FORMATS:
+        raise HTTPException(status_code=422, detail=f"Invalid stream format. Supported formats are: {STREAM_FORMATS}")
+    if stream is not None and parallel:
+        raise HTTPException(status_code=422, detail="'stream' cannot be combined with 'parallel'")
+    # '?multichannel=true' decodifica cada canal por separado en lugar de mezclarlos a mono.
+    if multichannel and (parallel or stream is not None):
+        raise HTTPException(status_code=422, detail="'multichannel' cannot be combined with 'parallel' or 'stream'")
+    # Control de admisión: si ya hay demasiados archivos en curso o la decodificación va
+    # retrasada, respondemos 503 con Retry-After en lugar de ralentizar a todos.
+    if not admission.ADMISSION.admit_file_job(overloaded=decoder.DECODE_EXECUTOR.saturated):
+        raise HTTPException(
+            status_code=503,
+            detail="Server is at capacity. Try again later.",
+            headers={"Retry-After": str(admission.ADMISSION.retry_after)},
+        )
+    metrics.BYTES.labels("http", "in").inc(_upload_size(file))
+    if stream is not None:
+        # El archivo cuenta como "en curso" hasta que termina la respuesta (ver '_FileJobStreamingResponse').
+        media_type = "text/event-stream" if stream == "sse" else "application/x-ndjson"
+        return _FileJobStreamingResponse(_streamed_transcription(file.file, model, stream), media_type=media_type)
     try:
-        # 2. CONVERTIR AUDIO CON FFmpeg
-        # Construimos el comando para FFmpeg: toma cualquier formato (-i) y lo convierte
-        # a PCM (s16le), con 16kHz de frecuencia de muestreo (-ar) y mono (-ac 1).
-        ffmpeg_command = [
-            "ffmpeg", "-i", temp_input_path, "-f", "s16le",
-            "-ar", "16000", "-ac", "1", temp_output_path
-        ]
-        # Ejecutamos FFmpeg. 'check=True' asegura que si falla, salte al 'except'.
-        subprocess.run(ffmpeg_command, check=True, capture_output=True)
-
-        # 3. TRANSCRIBIR CON VOSK
-        with open(temp_output_path, "rb") as pcm_file:
-            audio_data = pcm_file.read()
-            # Inicializamos el reconocedor de Vosk con el modelo cargado.
-            recognizer = services.KaldiRecognizer(services.VOSK_MODEL, 16000)
-            # Procesamos la onda de audio completa.
-            recognizer.AcceptWaveform(audio_data)
-            # Obtenemos el resultado final como JSON y lo cargamos.
-            result = json.loads(recognizer.FinalResult())
-            # Devolvemos solo el texto de la transcripción.
-            return {"text": result.get("text", "")}
-
-    except subprocess.CalledProcessError as e:
+        # Con 'parallel=true' los archivos largos se dividen en los silencios y se decodifican
+        # por segmentos en paralelo. Los archivos ya transcritos salen de la caché.
+        return await transcription.transcribe(file.file, parallel=parallel, model=model, multichannel=multichannel)
+    except audio.ConversionError as e:
         # Manejo de error si FFmpeg falla durante la conversión.
-        return {"error": "Failed to convert audio file", "details": e.stderr.decode()}
+        return {"error": "Failed to convert audio file", "details": e.details}
+    except models.ModelLoadError as e:
+        raise HTTPException(status_code=503, detail=str(e))
     finally:
-        # 4. LIMPIEZA
-        # Aseguramos que los archivos temporales se eliminen, independientemente del resultado.
-        if os.path.exists(temp_input_path):
-            os.remove(temp_input_path)
-        if os.path.exists(temp_output_path):
-            os.remove(temp_output_path)
+        admission.ADMISSION.release_file_job()
+
+# ----------------------------------------------------------------------
+## Trabajos de Transcripción Asíncronos (/jobs)
+# ----------------------------------------------------------------------
+
+def _save_upload(upload):
+    # Guardamos el archivo en disco: el trabajo se ejecutará cuando la petición ya haya terminado.
+    with tempfile.NamedTemporaryFile(delete=False, suffix=os.path.splitext(upload.filename or "")[1]) as f:
+        shutil.copyfileobj(upload.file, f)
+        return f.name
+
+def _get_job(job_id):
+    job = jobs.JOB_SCHEDULER.jobs.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job
+
+@app.post("/jobs")
+async def create_jobs(
+    request: Request,
+    files: List[UploadFile] = File(...),
+    priority: int = jobs.DEFAULT_PRIORITY,
+    parallel: bool = False,
+    x_client_id: Optional[str] = Header(None),
+):
+    if not jobs.MIN_PRIORITY <= priority <= jobs.MAX_PRIORITY:
+        raise HTTPException(
+            status_code=422,
+            detail=f"Priority must be between {jobs.MIN_PRIORITY} and {jobs.MAX_PRIORITY}",
+        )
+    # Los turnos se reparten por cliente: la cabecera X-Client-Id o, si no viene, la IP.
+    client = x_client_id or (request.client.host if request.client else "anonymous")
+    loop = asyncio.get_running_loop()
+    created = []
+    for upload in files:
+        metrics.BYTES.labels("http", "in").inc(_upload_size(upload))
+        path = await loop.run_in_executor(None, _save_upload, upload)
+        job = await jobs.JOB_SCHEDULER.submit(jobs.Job(path, upload.filename, client, priority, parallel))
+        created.append({"id": job.id, "filename": job.filename, "status": job.status})
+    return {"jobs": created}
+
+@app.get("/jobs/{job_id}")
+async def get_job(job_id: str):
+    return _get_job(job_id).to_dict()
+
+@app.get("/jobs/{job_id}/events")
+async def job_events(job_id: str):
+    job = _get_job(job_id)
+
+    # Enviamos el estado (una línea JSON por cambio) hasta que el trabajo termina.
+    async def events():
+        while True:
+            status = job.status
+            yield json.dumps(job.to_dict(), ensure_ascii=False) + "\n"
+            if status in jobs.FINISHED_STATES:
+                return
+            async with job.changed:
+                await job.changed.wait_for(lambda: job.status != status)
+
+    return StreamingResponse(events(), media_type="application/x-ndjson")
+
+@app.delete("/jobs/{job_id}")
+async def cancel_job(job_id: str):
+    job = _get_job(job_id)
+    if job.status not in jobs.FINISHED_STATES:
+        await jobs.JOB_SCHEDULER.cancel(job)
+    return job.to_dict()
 
 # ----------------------------------------------------------------------
 ## Endpoint WebSocket para Transcripción en Tiempo Real (/ws/transcribe)
 # ----------------------------------------------------------------------
 
+async def _reject_handshake(websocket, reason, message, code=1008, **extra):
+    # Rechaza el handshake: envía el error al cliente, cierra la conexión y lo cuenta en /metrics.
+    # Por defecto se cierra con el código 1008 (Violación de Política).
+    metrics.HANDSHAKE_REJECTIONS.labels(reason).inc()
+    await websocket.send_json({"type": "error", "message": message, **extra})
+    await websocket.close(code=code)
+
+async def _send_all(websocket, messages, encoding, unsent):
+    # Envía los resultados en orden. Si la conexión se corta, guarda en 'unsent' los que
+    # faltan, para entregarlos si el cliente reanuda la sesión.
+    for i, message in enumerate(messages):
+        try:
+            await streaming.send_message(websocket, message, encoding)
+        except WebSocketDisconnect:
+            unsent.extend(messages[i:])
+            raise
+
+async def _read_client(websocket, buffer):
+    # Lee mensajes del socket y los deja en la cola del stream. Si la cola está llena
+    # (la decodificación va retrasada), 'put' espera y dejamos de leer del socket.
+    while True:
+        try:
+            data = await websocket.receive()
+        except Exception:
+            data = {"type": "websocket.disconnect", "code": 1006}
+        size = len(data.get("bytes") or data.get("text") or b"")
+        metrics.BYTES.labels("ws", "in").inc(size)
+        await buffer.put(data, size)
+        if data["type"] == "websocket.disconnect":
+            return
+
 @app.websocket("/ws/transcribe")
 async def websocket_endpoint(websocket: WebSocket):
     # Aceptamos la conexión WebSocket entrante.
     await websocket.accept()
-    recognizer = None
-    SUPPORTED_SAMPLE_RATES = [16000] 
+    session = None
+    reader = None
+    admitted = False
+    model = None
+    # Sesión reanudable: token, bytes de audio del cliente ya procesados y resultados pendientes de enviar.
+    token = None
+    received = 0
+    unsent = []
+    # El audio se remuestrea y se mezcla a mono en el servidor, así que el cliente puede
+    # enviar su frecuencia y número de canales nativos.
+    SUPPORTED_SAMPLE_RATES = [8000, 16000, 22050, 44100, 48000]
+    SUPPORTED_CHANNELS = [1, 2]
 
     try:
         # 1. ESPERAR HANDSHAKE DE INICIO
@@ -98,53 +353,139 @@ async def websocket_endpoint(websocket: WebSocket):
         handshake = await websocket.receive_json()
         
         # --- MANEJO DE ERRORES DE PROTOCOLO ---
-        if handshake.get("type") != "start":
+        if handshake.get("type") not in ("start", "resume"):
             # Si el cliente no envía el mensaje 'start' primero, es un error de protocolo.
-            await websocket.send_json({
-                "type": "error",
-                "message": "Invalid handshake. First message must be of type 'start'."
-            })
-            # Cerramos la conexión con código 1008 (Violación de Política).
-            await websocket.close(code=1008)
-            return
-        # ----------------------------------------
-        if handshake.get("channels") != 1:
-            await websocket.send_json({
-                "type": "error",
-                "message": "Invalid audio format. Only 1 channel (mono) is supported."
-            })
-            await websocket.close(code=1008)
+            await _reject_handshake(
+                websocket, "protocol", "Invalid handshake. First message must be of type 'start'."
+            )
             return
         # ----------------------------------------
-        sample_rate = handshake.get("sample_rate", 16000)
-        if sample_rate not in SUPPORTED_SAMPLE_RATES:
-            await websocket.send_json({
-                "type": "error",
-                "message": f"Unsupported sample rate. Supported rates are: {SUPPORTED_SAMPLE_RATES}"
-            })
-            await websocket.close(code=1008)
-            return
-        # Inicializamos el reconocedor de Vosk para esta conexión específica.
-        recognizer = services.KaldiRecognizer(services.VOSK_MODEL, sample_rate)
+        if handshake.get("type") == "resume":
+            # Reanudación de una sesión cortada: recuperamos el reconocedor y su estado.
+            parked = sessions.SESSION_TABLE.claim(handshake.get("session_id"))
+            if parked is None:
+                await _reject_handshake(websocket, "resume", "Unknown or expired session.")
+                return
+            if not admission.ADMISSION.admit_stream(overloaded=decoder.DECODE_EXECUTOR.saturated):
+                # La dejamos aparcada para que el cliente pueda reintentar más tarde.
+                sessions.SESSION_TABLE.park(parked)
+                await _reject_handshake(
+                    websocket, "capacity", "Server is at capacity. Try again later.",
+                    code=1013, retry_after=admission.ADMISSION.retry_after,
+                )
+                return
+            admitted = True
+            session, model, encoding = parked.session, parked.model, parked.encoding
+            token, received = parked.token, parked.offset
+            # Indicamos al cliente desde qué byte de su audio tiene que seguir enviando
+            # y le entregamos los resultados que no llegó a recibir.
+            try:
+                await streaming.send_message(
+                    websocket, {"type": "resumed", "text": "", "session_id": token, "offset": received}, encoding
+                )
+            except WebSocketDisconnect:
+                unsent.extend(parked.unsent)
+                raise
+            await _send_all(websocket, parked.unsent, encoding, unsent)
+        else:
+            # ----------------------------------------
+            channels = handshake.get("channels")
+            if channels not in SUPPORTED_CHANNELS:
+                await _reject_handshake(
+                    websocket, "channels", f"Invalid audio format. Supported channel counts are: {SUPPORTED_CHANNELS}"
+                )
+                return
+            # ----------------------------------------
+            sample_rate = handshake.get("sample_rate", 16000)
+            # Opus tiene sus propias frecuencias (se decodifica directamente a 16 kHz, sin remuestrear).
+            supported_rates = codec.OPUS_SAMPLE_RATES if handshake.get("codec") == "opus" else SUPPORTED_SAMPLE_RATES
+            if sample_rate not in supported_rates:
+                await _reject_handshake(
+                    websocket, "sample_rate", f"Unsupported sample rate. Supported rates are: {supported_rates}"
+                )
+                return
+            # ----------------------------------------
+            # Modelo elegido por el cliente (opcional, por defecto el modelo por defecto del registro).
+            try:
+                model_name = models.MODEL_REGISTRY.get(handshake.get("model")).name
+            except models.ModelNotFound as e:
+                await _reject_handshake(websocket, "model", str(e))
+                return
+            # ----------------------------------------
+            # Control de admisión: si el servidor está al límite, rechazamos el stream durante
+            # el handshake con una pista de cuándo reintentar.
+            if not admission.ADMISSION.admit_stream(overloaded=decoder.DECODE_EXECUTOR.saturated):
+                # Código 1013: "Try Again Later".
+                await _reject_handshake(
+                    websocket, "capacity", "Server is at capacity. Try again later.",
+                    code=1013, retry_after=admission.ADMISSION.retry_after,
+                )
+                return
+            admitted = True
+            # ----------------------------------------
+            # Codec del audio enviado ('codec'): PCM s16le (por defecto), G.711 µ-law/A-law u Opus.
+            # Se decodifica en el servidor bloque a bloque, sin FFmpeg.
+            try:
+                stream_codec = codec.codec_from_handshake(handshake.get("codec"), sample_rate, channels)
+            except ValueError as e:
+                await _reject_handshake(websocket, "codec", str(e))
+                return
+            # Si el audio decodificado no es ya 16 kHz mono, lo convertimos bloque a bloque.
+            resampler = None
+            if stream_codec.sample_rate != audio.PCM_SAMPLE_RATE or stream_codec.channels != 1:
+                resampler = resample.StreamResampler(stream_codec.sample_rate, audio.PCM_SAMPLE_RATE, stream_codec.channels)
+            # Detector de actividad de voz opcional ('vad': true o con opciones).
+            # Trabaja sobre el audio ya convertido a 16 kHz.
+            # También leemos cómo quiere recibir los resultados: política de parciales y codificación.
+            try:
+                gate = vad.gate_from_handshake(handshake.get("vad"), audio.PCM_SAMPLE_RATE)
+                options = streaming.stream_options_from_handshake(handshake)
+            except ValueError as e:
+                await _reject_handshake(websocket, "options", str(e))
+                return
+            # Obtenemos el modelo (si no está cargado, esperamos a que se cargue en segundo plano).
+            try:
+                model = await models.MODEL_REGISTRY.acquire(model_name)
+            except models.ModelLoadError as e:
+                # Código 1011: error interno del servidor.
+                await _reject_handshake(websocket, "model", str(e), code=1011)
+                return
+            # Tomamos un reconocedor de Vosk del pool para esta conexión específica.
+            # El carril del ejecutor de decodificación mantiene en orden las llamadas de este reconocedor.
+            lane = decoder.DECODE_EXECUTOR.lane()
+            session = streaming.StreamSession(
+                await services.RECOGNIZER_POOL.acquire(model, audio.PCM_SAMPLE_RATE, lane), lane,
+                resampler=resampler, vad=gate, codec=stream_codec,
+                partials=options["partials"], partial_interval=options["partial_interval"],
+            )
+            encoding = options["encoding"]
+            # Sesión reanudable opcional ('resumable': true): enviamos el token para reconectar.
+            if handshake.get("resumable"):
+                token = sessions.SESSION_TABLE.new_token()
+                await streaming.send_message(
+                    websocket, {"type": "session", "text": "", "session_id": token, "offset": 0}, encoding
+                )
 
         # 2. BUCLE PRINCIPAL DE RECEPCIÓN DE DATOS (Stream)
+        # Un lector en segundo plano recibe del socket mientras aquí se decodifica; la cola
+        # entre ambos está limitada en bytes (backpressure).
+        buffer = admission.AudioBuffer(controller=admission.ADMISSION)
+        reader = asyncio.ensure_future(_read_client(websocket, buffer))
         while True:
-            # Esperamos recibir un mensaje del cliente.
-            data = await websocket.receive()
+            # Esperamos el siguiente mensaje del cliente.
+            data = await buffer.get()
+            if data["type"] == "websocket.disconnect":
+                raise WebSocketDisconnect(data.get("code", 1000))
 
             # La forma más confiable: verificamos el TIPO de dato recibido.
             # Primero, verificamos si el mensaje contiene audio en bytes.
             if 'bytes' in data and isinstance(data['bytes'], bytes):
                 audio_chunk = data['bytes']
-                # Si es audio (bytes), lo enviamos al reconocedor de Vosk.
-                if recognizer.AcceptWaveform(audio_chunk):
-                    # Si Vosk reconoce una frase completa, enviamos el resultado 'final'.
-                    result = json.loads(recognizer.Result())
-                    await websocket.send_json({"type": "final", "text": result.get("text", "")})
-                else:
-                    # Si no ha reconocido una frase completa, enviamos un resultado 'partial' (parcial).
-                    partial_result = json.loads(recognizer.PartialResult())
-                    await websocket.send_json({"type": "partial", "text": partial_result.get("partial", "")})
+                # Si es audio (bytes), lo enviamos al reconocedor de Vosk y mandamos
+                # los resultados 'partial' o 'final' que produzca.
+                messages = await session.accept_audio(audio_chunk)
+                received += len(audio_chunk)
+                await _send_all(websocket, messages, encoding, unsent)
             
             # Si no es audio, verificamos si es un mensaje de texto.
             elif 'text' in data and isinstance(data['text'], str):
@@ -154,8 +495,7 @@ async def websocket_endpoint(websocket: WebSocket):
                     message_data = json.loads(text_payload)
                     if message_data.get("type") == "eof":
                         # Si el cliente envía 'eof', forzamos el último resultado final de Vosk.
-                        final_result = json.loads(recognizer.FinalResult())
-                        await websocket.send_json({"type": "final", "text": final_result.get("text", "")})
+                        await _send_all(websocket, [await session.finish()], encoding, unsent)
                         break # Salimos del bucle para cerrar la conexión.
                 except json.JSONDecodeError:
                     print(f"Received non-JSON text message: {text_payload}")
@@ -163,12 +503,17 @@ async def websocket_endpoint(websocket: WebSocket):
     except WebSocketDisconnect:
         # Manejo de la desconexión normal o abrupta por parte del cliente.
         print("Cliente desconectado.")
+        if session and token is not None:
+            # Sesión reanudable: la aparcamos sin cerrar la frase, para que el cliente pueda volver.
+            # A partir de aquí el reconocedor y el modelo pertenecen a la tabla de sesiones.
+            sessions.SESSION_TABLE.park(sessions.ParkedSession(token, session, model, encoding, received, unsent))
+            session = model = None
         # Intentamos obtener y enviar el resultado final, por si la desconexión fue inesperada.
-        if recognizer:
-            final_result = json.loads(recognizer.FinalResult())
+        elif session:
+            final_result = await session.finish()
             if final_result.get("text"):
                 try:
-                    await websocket.send_json({"type": "final", "text": final_result.get("text", "")})
+                    await streaming.send_message(websocket, final_result, encoding)
                 except Exception:
                     pass # Evitamos que un error de envío cause otro error.
     except Exception as e:
@@ -183,7 +528,17 @@ async def websocket_endpoint(websocket: WebSocket):
         except Exception:
             pass
     finally:
-            # Aseguramos que la conexión se cierre al finalizar
+            if reader is not None:
+                reader.cancel()
+            if admitted:
+                admission.ADMISSION.release_stream()
+            if session is not None:
+                # El reconocedor solo vuelve al pool si la sesión terminó con su resultado final.
+                services.RECOGNIZER_POOL.release(session.recognizer, session.finished)
+            if model is not None:
+                models.MODEL_REGISTRY.release(model)
+            # Aseguramos que la conexión se cierre al finalizar (si no se cerró ya, p. ej. por un error de handshake).
             print("Cerrando la conexión desde el servidor.")
-            await websocket.close()
+            if websocket.application_state == WebSocketState.CONNECTED:
+                await websocket.close()
 
@@ -0,0 +1,181 @@
+import threading
+
+# Métricas en formato de texto de Prometheus (GET /metrics).
+# Implementación mínima de contadores, gauges e histogramas para no añadir dependencias.
+# Los valores se pueden actualizar desde cualquier hilo (p. ej. desde el ejecutor de decodificación).
+
+# Límites de los histogramas de latencia (segundos) y de factor de tiempo real.
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+RTF_BUCKETS = (0.05, 0.1, 0.2, 0.3, 0.5, 0.75, 1, 1.5, 2, 5)
+
+REGISTRY = []
+
+
+def _format_labels(names, values, extra=None):
+    pairs = list(zip(names, values))
+    if extra:
+        pairs.append(extra)
+    if not pairs:
+        return ""
+    escaped = (str(value).replace("\\", "\\\\").replace('"', '\\"') for _, value in pairs)
+    return "{" + ",".join(f'{name}="{value}"' for (name, _), value in zip(pairs, escaped)) + "}"
+
+
+class _Metric:
+    kind = None
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        self._children = {}
+        REGISTRY.append(self)
+
+    def labels(self, *values):
+        """Devuelve la serie correspondiente a unos valores de etiquetas."""
+        with self._lock:
+            child = self._children.get(values)
+            if child is None:
+                child = self._children[values] = self._new_child()
+            return child
+
+    def _new_child(self):
+        raise NotImplementedError
+
+    def _default(self):
+        # Las métricas sin etiquetas usan una única serie.
+        return self.labels()
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        with self._lock:
+            children = list(self._children.items())
+        for values, child in children:
+            lines.extend(child.render(self.name, self.labelnames, values))
+        return lines
+
+
+class _CounterChild:
+    def __init__(self):
+        self.value = 0.0
+
+    def inc(self, amount=1):
+        self.value += amount
+
+    def render(self, name, labelnames, values):
+        return [f"{name}{_format_labels(labelnames, values)} {self.value}"]
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def _new_child(self):
+        return _CounterChild()
+
+    def inc(self, amount=1):
+        self._default().inc(amount)
+
+
+class Gauge(_Metric):
+    """Gauge cuyo valor se lee en el momento de generar /metrics."""
+
+    kind = "gauge"
+
+    def __init__(self, name, documentation, read):
+        super().__init__(name, documentation)
+        self._read = read
+
+    def render(self):
+        try:
+            value = float(self._read())
+        except Exception:
+            # Si el componente todavía no existe (p. ej. durante el arranque), no publicamos valor.
+            return []
+        return [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} gauge", f"{self.name} {value}"]
+
+
+class _HistogramChild:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.count = 0
+        self.sum = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, value):
+        with self._lock:
+            self.count += 1
+            self.sum += value
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    self.counts[i] += 1
+                    break
+
+    def render(self, name, labelnames, values):
+        with self._lock:
+            counts, count, total = list(self.counts), self.count, self.sum
+        lines = []
+        cumulative = 0
+        for bound, n in zip(self.buckets, counts):
+            cumulative += n
+            lines.append(f"{name}_bucket{_format_labels(labelnames, values, ('le', bound))} {cumulative}")
+        lines.append(f"{name}_bucket{_format_labels(labelnames, values, ('le', '+Inf'))} {count}")
+        lines.append(f"{name}_sum{_format_labels(labelnames, values)} {total}")
+        lines.append(f"{name}_count{_format_labels(labelnames, values)} {count}")
+        return lines
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS):
+        self.buckets = tuple(buckets)
+        super().__init__(name, documentation, labelnames)
+
+    def _new_child(self):
+        return _HistogramChild(self.buckets)
+
+    def observe(self, value):
+        self._default().observe(value)
+
+
+def render():
+    """Genera el texto de todas las métricas registradas."""
+    lines = []
+    for metric in REGISTRY:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+# ----------------------------------------------------------------------
+## Métricas de la aplicación
+# ----------------------------------------------------------------------
+
+STREAM_RTF = Histogram(
+    "transcription_stream_rtf", "Real-time factor per WebSocket stream (decode time / audio time)",
+    buckets=RTF_BUCKETS,
+)
+JOB_RTF = Histogram(
+    "transcription_file_rtf", "Real-time factor per file transcription (wall time / audio time)",
+    buckets=RTF_BUCKETS,
+)
+UPLOAD_DECODE_PATH = Counter(
+    "transcription_upload_decode_total", "Uploads decoded directly from WAV or converted with FFmpeg",
+    labelnames=("path",),
+)
+FFMPEG_SECONDS = Histogram("transcription_ffmpeg_seconds", "FFmpeg conversion time per file")
+ACCEPT_WAVEFORM_SECONDS = Histogram("transcription_accept_waveform_seconds", "AcceptWaveform time per chunk")
+SEND_SECONDS = Histogram(
+    "transcription_send_seconds", "Serialization and send time per result message", labelnames=("type",)
+)
+RECOGNIZER_ACQUIRE_SECONDS = Histogram(
+    "transcription_recognizer_acquire_seconds", "Time to obtain a recognizer (from the pool or new)",
+    labelnames=("source",),
+)
+QUEUE_WAIT_SECONDS = Histogram("transcription_decode_queue_wait_seconds", "Time spent waiting in the decode queue")
+HANDSHAKE_REJECTIONS = Counter(
+    "transcription_handshake_rejections_total", "WebSocket handshakes rejected", labelnames=("reason",)
+)
+BYTES = Counter(
+    "transcription_bytes_total", "Bytes received and sent", labelnames=("protocol", "direction")
+)
@@ -0,0 +1,249 @@
+import asyncio
+import os
+import time
+from . import services
+
+# Registro de modelos de Vosk.
+# Descubre las carpetas de modelos disponibles y los carga bajo demanda (en segundo plano)
+# la primera vez que una conexión o un archivo los pide. Los modelos cargados se guardan en
+# un LRU con presupuesto de memoria: si hace falta sitio, se descarga el que lleva más tiempo
+# sin usarse, pero nunca uno que está en uso (cada sesión cuenta como una referencia).
+
+# Carpeta con un modelo por subcarpeta (el nombre de la subcarpeta es el nombre del modelo).
+MODELS_DIR = os.environ.get("MODELS_DIR", "models")
+# Modelo usado cuando el cliente no elige ninguno. "default" es la carpeta 'model' de siempre.
+DEFAULT_MODEL = os.environ.get("DEFAULT_MODEL", "default")
+# Memoria máxima para modelos cargados, estimada por el tamaño de sus archivos (0 = sin límite).
+MODELS_MAX_BYTES = int(os.environ.get("MODELS_MAX_BYTES", 0))
+# Modelos que se empiezan a cargar al arrancar, separados por comas (vacío = ninguno).
+PRELOAD_MODELS = [name for name in os.environ.get("PRELOAD_MODELS", DEFAULT_MODEL).split(",") if name]
+
+# Variable global con el registro (se crea una sola vez al iniciar la aplicación).
+MODEL_REGISTRY = None
+
+
+class ModelNotFound(Exception):
+    """El cliente pidió un modelo que no existe."""
+
+
+class ModelLoadError(Exception):
+    """El modelo existe pero no se pudo cargar."""
+
+
+def _directory_size(path):
+    total = 0
+    for root, _, files in os.walk(path):
+        for name in files:
+            try:
+                total += os.path.getsize(os.path.join(root, name))
+            except OSError:
+                pass
+    return total
+
+
+def discover_models(models_dir=MODELS_DIR, default_path=services.MODEL_PATH):
+    """Devuelve {nombre: carpeta} con los modelos disponibles."""
+    found = {}
+    if os.path.isdir(default_path):
+        found["default"] = default_path
+    if os.path.isdir(models_dir):
+        for name in sorted(os.listdir(models_dir)):
+            path = os.path.join(models_dir, name)
+            if os.path.isdir(path):
+                found[name] = path
+    return found
+
+
+class ModelEntry:
+    """Un modelo del registro y su estado de carga."""
+
+    def __init__(self, name, path):
+        self.name = name
+        self.path = path
+        self.size = _directory_size(path)
+        self.model = None
+        self.identity = None
+        self.error = None
+        self.refs = 0
+        self.pinned = False
+        self.last_used = 0.0
+        self._loading = None
+
+    @property
+    def state(self):
+        if self.model is not None:
+            return "loaded"
+        if self._loading is not None and not self._loading.done():
+            return "loading"
+        return "failed" if self.error else "available"
+
+    def to_dict(self):
+        return {"state": self.state, "size": self.size, "refs": self.refs, "error": self.error}
+
+
+class ModelRegistry:
+    """Modelos disponibles, cargados bajo demanda, con LRU por memoria y conteo de referencias."""
+
+    def __init__(self, paths, default=DEFAULT_MODEL, max_bytes=MODELS_MAX_BYTES, loader=None, on_evict=None):
+        self.entries = {name: ModelEntry(name, path) for name, path in paths.items()}
+        self.default = default
+        self.max_bytes = max_bytes
+        self._loader = loader or services.load_vosk_model
+        # Se llama al descargar un modelo, p. ej. para soltar sus reconocedores libres del pool.
+        self._on_evict = on_evict
+        self._tasks = []
+        self.loads = 0
+        self.evictions = 0
+
+    @property
+    def names(self):
+        return list(self.entries)
+
+    @property
+    def resident_bytes(self):
+        return sum(entry.size for entry in self.entries.values() if entry.model is not None)
+
+    @property
+    def ready(self):
+        """True cuando el modelo por defecto está cargado y se pueden atender peticiones sin esperar."""
+        entry = self.entries.get(self.default)
+        return entry is not None and entry.model is not None
+
+    def get(self, name=None):
+        """Devuelve la entrada de un modelo (el de por defecto si 'name' es None)."""
+        name = name or self.default
+        if not isinstance(name, str) or name not in self.entries:
+            raise ModelNotFound(f"Unknown model '{name}'. Available models are: {self.names}")
+        return self.entries[name]
+
+    def load_now(self, name=None):
+        """Carga un modelo de forma bloqueante y lo fija en memoria (nunca se descarga)."""
+        entry = self.get(name)
+        if entry.model is None:
+            entry.model = self._loader(entry.path)
+            entry.identity = services.model_identity(entry.path)
+            self.loads += 1
+        entry.pinned = True
+        return entry
+
+    async def acquire(self, name=None):
+        """Obtiene un modelo cargado para una sesión, cargándolo si hace falta.
+
+        Hay que devolverlo con 'release' al terminar la sesión.
+        """
+        entry = self.get(name)
+        # Contamos la referencia antes de esperar: así no se descarga mientras lo esperamos.
+        entry.refs += 1
+        try:
+            if entry.model is None:
+                await self._load(entry)
+        except BaseException:
+            entry.refs -= 1
+            raise
+        entry.last_used = time.monotonic()
+        return entry
+
+    def release(self, entry):
+        entry.refs -= 1
+        entry.last_used = time.monotonic()
+        # Si antes nos pasamos del presupuesto porque todo estaba en uso, ahora puede haber hueco.
+        self._evict(0)
+
+    async def _load(self, entry):
+        # Todas las sesiones que piden el mismo modelo esperan a la misma carga.
+        if entry._loading is None:
+            entry._loading = asyncio.ensure_future(self._load_in_thread(entry))
+        try:
+            await asyncio.shield(entry._loading)
+        finally:
+            if entry._loading is not None and entry._loading.done():
+                entry._loading = None
+
+    async def _load_in_thread(self, entry):
+        loop = asyncio.get_running_loop()
+        # Hacemos sitio antes de cargar, para no pasarnos del presupuesto con los dos a la vez.
+        self._evict(entry.size)
+        started = time.perf_counter()
+        print(f"Cargando modelo '{entry.name}' desde '{entry.path}'...")
+        try:
+            # La carga es lenta y bloqueante: se hace en un hilo para no congelar el event loop.
+            model = await loop.run_in_executor(None, self._loader, entry.path)
+        except Exception as e:
+            entry.error = str(e)
+            raise ModelLoadError(f"Failed to load model '{entry.name}': {e}") from e
+        entry.model = model
+        entry.identity = services.model_identity(entry.path)
+        entry.error = None
+        # El modelo por defecto no se descarga nunca: de él depende /ready, y un nodo
+        # "no listo" deja de recibir tráfico y no volvería a cargarlo.
+        entry.pinned = entry.name == self.default
+        self.loads += 1
+        print(f"Modelo '{entry.name}' cargado en {time.perf_counter() - started:.1f} s.")
+
+    def _evict(self, needed):
+        # Descarga los modelos sin uso más antiguos hasta que quepan 'needed' bytes más.
+        if not self.max_bytes:
+            return
+        while self.resident_bytes + needed > self.max_bytes:
+            idle = [
+                entry for entry in self.entries.values()
+                if entry.model is not None and entry.refs == 0 and not entry.pinned
+            ]
+            if not idle:
+                # Todo lo cargado está en uso: nos pasamos del presupuesto hasta que se libere algo.
+                return
+            entry = min(idle, key=lambda e: e.last_used)
+            entry.model = None
+            self.evictions += 1
+            if self._on_evict is not None:
+                self._on_evict(entry.name)
+            print(f"Modelo '{entry.name}' descargado de memoria.")
+
+    def preload(self, names, on_loaded=None):
+        """Empieza a cargar modelos en segundo plano sin bloquear el arranque.
+
+        'on_loaded' es una corrutina que recibe cada entrada ya cargada (p. ej. para precalentar).
+        """
+        async def preload_one(name):
+            try:
+                entry = await self.acquire(name)
+            except (ModelNotFound, ModelLoadError) as e:
+                print(f"No se pudo precargar el modelo: {e}")
+                return
+            try:
+                if on_loaded is not None:
+                    await on_loaded(entry)
+            finally:
+                self.release(entry)
+
+        self._tasks.extend(asyncio.ensure_future(preload_one(name)) for name in names)
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+
+    def stats(self):
+        return {
+            "default": self.default,
+            "ready": self.ready,
+            "resident_bytes": self.resident_bytes,
+            "max_bytes": self.max_bytes,
+            "loads": self.loads,
+            "evictions": self.evictions,
+            "models": {name: entry.to_dict() for name, entry in self.entries.items()},
+        }
+
+
+def create_model_registry():
+    """Crea el registro de modelos a partir de las carpetas encontradas."""
+    global MODEL_REGISTRY
+    MODEL_REGISTRY = ModelRegistry(discover_models(), on_evict=lambda name: services.RECOGNIZER_POOL.drop(name))
+    print(f"Modelos disponibles: {MODEL_REGISTRY.names} (por defecto: '{MODEL_REGISTRY.default}').")
+
+
+async def stop_model_registry():
+    global MODEL_REGISTRY
+    if MODEL_REGISTRY is not None:
+        await MODEL_REGISTRY.stop()
+        MODEL_REGISTRY = None
@@ -0,0 +1,113 @@
+import math
+import threading
+import time
+import numpy as np
+
+# Remuestreo y mezcla a mono en el servidor para /ws/transcribe.
+# Permite que los clientes envíen el audio a su frecuencia nativa (8 kHz, 44.1 kHz, 48 kHz...)
+# y en estéreo: cada bloque se convierte a 16 kHz mono antes de llegar a Vosk.
+# Se usa un remuestreador polifásico vectorizado con NumPy que conserva el estado del
+# filtro entre bloques, así que no hay cortes en los bordes de cada mensaje.
+
+# Coeficientes por fase del filtro. Con 32, el retardo añadido es de 16 muestras de
+# entrada (2 ms a 8 kHz, 0.3 ms a 48 kHz).
+TAPS_PER_PHASE = 32
+
+# Coste acumulado de remuestrear (segundos de CPU por segundo de audio), para publicarlo en /stats.
+_stats_lock = threading.Lock()
+_audio_seconds = 0.0
+_cpu_seconds = 0.0
+
+
+def _record(audio_seconds, cpu_seconds):
+    global _audio_seconds, _cpu_seconds
+    with _stats_lock:
+        _audio_seconds += audio_seconds
+        _cpu_seconds += cpu_seconds
+
+
+def stats():
+    """Devuelve el audio remuestreado y el coste de CPU por segundo de audio."""
+    with _stats_lock:
+        return {
+            "audio_seconds": _audio_seconds,
+            "cpu_seconds": _cpu_seconds,
+            "cpu_per_audio_second": _cpu_seconds / _audio_seconds if _audio_seconds else 0.0,
+        }
+
+
+def _design_filter(up, down, taps_per_phase):
+    # Filtro paso bajo (sinc con ventana de Kaiser) a la frecuencia intermedia 'in_rate * up',
+    # con el corte en la menor de las dos frecuencias de Nyquist. Se devuelve ya dividido en fases.
+    length = taps_per_phase * up
+    cutoff = 0.5 / max(up, down) * 0.95
+    n = np.arange(length) - (length - 1) / 2
+    h = 2 * cutoff * np.sinc(2 * cutoff * n) * np.kaiser(length, 8.0) * up
+    # Fase p: coeficientes h[p], h[p + up], h[p + 2*up]...
+    return h.reshape(taps_per_phase, up).T.astype(np.float32)
+
+
+class StreamResampler:
+    """Convierte PCM s16le intercalado (N canales, cualquier frecuencia) a mono en 'out_rate'."""
+
+    def __init__(self, in_rate, out_rate=16000, channels=1, taps_per_phase=TAPS_PER_PHASE):
+        self.in_rate = in_rate
+        self.out_rate = out_rate
+        self.channels = channels
+        g = math.gcd(in_rate, out_rate)
+        self.up = out_rate // g
+        self.down = in_rate // g
+        self.taps = taps_per_phase
+        self._phases = _design_filter(self.up, self.down, taps_per_phase)
+        self._offsets = np.arange(taps_per_phase)
+        # Historial de entrada: empieza con ceros para las primeras muestras del filtro.
+        self._history = np.zeros(taps_per_phase - 1, dtype=np.float32)
+        # Índice absoluto de la primera muestra del historial y de la siguiente muestra de salida.
+        self._history_start = -(taps_per_phase - 1)
+        self._next_output = 0
+        self._leftover = b""
+        self.audio_seconds = 0.0
+        self.cpu_seconds = 0.0
+
+    def process(self, chunk):
+        """Procesa un bloque y devuelve el PCM s16le mono remuestreado que ya se puede producir."""
+        started = time.perf_counter()
+        frame = 2 * self.channels
+        data = self._leftover + chunk
+        usable = len(data) - len(data) % frame
+        self._leftover = data[usable:]
+        samples = np.frombuffer(data[:usable], dtype="<i2")
+
+        # 1. Mezcla a mono: promedio de los canales de cada frame.
+        if self.channels > 1:
+            mono = samples.reshape(-1, self.channels).mean(axis=1, dtype=np.float32)
+        else:
+            mono = samples.astype(np.float32)
+        buffer = np.concatenate((self._history, mono))
+        available = self._history_start + len(buffer)
+
+        # 2. Salidas que se pueden calcular con la entrada disponible:
+        #    la salida n usa la entrada (n * down) // up y las 'taps - 1' anteriores.
+        last_output = (available * self.up - 1) // self.down
+        outputs = np.arange(self._next_output, last_output + 1, dtype=np.int64)
+        if len(outputs):
+            position = outputs * self.down
+            base = position // self.up - self._history_start
+            window = buffer[base[:, None] - self._offsets[None, :]]
+            result = np.einsum("ij,ij->i", window, self._phases[position % self.up])
+            out = np.clip(np.rint(result), -32768, 32767).astype("<i2").tobytes()
+            self._next_output = int(outputs[-1]) + 1
+        else:
+            out = b""
+
+        # 3. Guardamos solo el historial que necesitará la siguiente salida.
+        keep_from = (self._next_output * self.down) // self.up - (self.taps - 1)
+        self._history = buffer[keep_from - self._history_start:]
+        self._history_start = keep_from
+
+        elapsed = time.perf_counter() - started
+        seconds = len(mono) / self.in_rate
+        self.audio_seconds += seconds
+        self.cpu_seconds += elapsed
+        _record(seconds, elapsed)
+        return out
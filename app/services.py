@@ -1,21 +1,214 @@
 from vosk import Model, KaldiRecognizer # <-- AÑADE ESTO
+from . import workers
+from . import metrics
+from . import audio
+from . import decoder
+import asyncio
+import collections
+import os
+import time
 
 # Importamos las clases necesarias de la librería Vosk.
 # 'Model' se usa para cargar los archivos del modelo de voz.
 # 'KaldiRecognizer' se usa para procesar el audio y obtener la transcripción.
 
-# Declaramos una variable global que contendrá el modelo de Vosk cargado.
-# Se inicializa a None y se llena solo una vez al inicio de la aplicación.
-VOSK_MODEL = None
+# Los modelos cargados se guardan en el registro de modelos (ver 'models'), que los carga
+# bajo demanda. Aquí solo están las funciones que hablan directamente con Vosk.
 
-def load_vosk_model():
-    """Carga el modelo de Vosk desde la carpeta 'model'."""
-    # Usamos 'global' para indicar que vamos a modificar la variable VOSK_MODEL
-    # que está definida fuera de esta función.
-    global VOSK_MODEL
-    
+# Carpeta del modelo de Vosk por defecto.
+MODEL_PATH = "model"
+
+# Pool de reconocedores: en lugar de crear y destruir un KaldiRecognizer por cada conexión,
+# se reutilizan los que quedan libres. Se puede ajustar con variables de entorno.
+# Reconocedores que se crean al arrancar (a 16 kHz), para que las primeras sesiones no esperen.
+RECOGNIZER_POOL_PREWARM = int(os.environ.get("RECOGNIZER_POOL_PREWARM", 4))
+# Máximo de reconocedores libres que se guardan por cada combinación de modelo, frecuencia y opciones.
+RECOGNIZER_POOL_MAX_IDLE = int(os.environ.get("RECOGNIZER_POOL_MAX_IDLE", 32))
+# Segundos que un reconocedor puede estar sin usarse antes de liberarlo.
+RECOGNIZER_POOL_IDLE_SECONDS = float(os.environ.get("RECOGNIZER_POOL_IDLE_SECONDS", 300))
+
+# Variable global con el pool de reconocedores (se crea una sola vez al iniciar la aplicación).
+RECOGNIZER_POOL = None
+
+def load_vosk_model(path=MODEL_PATH):
+    """Carga un modelo de Vosk desde su carpeta y lo devuelve."""
     # Creamos una instancia del objeto Model, indicando la ruta donde se encuentra el modelo.
-    # Este proceso solo debe ejecutarse una vez al iniciar la API (como se ve en app.main).
-    VOSK_MODEL = Model("model")
-    
-    print("Modelo de Vosk cargado exitosamente.")
\ No newline at end of file
+    # Es lento y ocupa mucha memoria: el registro de modelos lo hace una sola vez por modelo.
+    model = Model(path)
+    print(f"Modelo de Vosk cargado exitosamente desde '{path}'.")
+    return model
+
+def model_identity(path=MODEL_PATH):
+    """Identifica un modelo (ruta y fecha de modificación), p. ej. para la caché de resultados."""
+    path = os.path.abspath(path)
+    return f"{path}@{os.path.getmtime(path)}"
+
+def accept_waveform(recognizer, data):
+    """Entrega audio al reconocedor y mide cuánto tarda Kaldi. Devuelve (frase_completa, segundos)."""
+    started = time.perf_counter()
+    accepted = recognizer.AcceptWaveform(data)
+    elapsed = time.perf_counter() - started
+    metrics.ACCEPT_WAVEFORM_SECONDS.observe(elapsed)
+    return accepted, elapsed
+
+def create_recognizer(sample_rate, model):
+    """Crea un reconocedor de Vosk para una sesión o un archivo."""
+    # Si los procesos de decodificación están activos y comparten este modelo, el reconocedor
+    # vive en uno de ellos (ver 'workers'); si no, se crea aquí mismo.
+    if workers.WORKER_POOL is not None and workers.WORKER_POOL.model is model:
+        try:
+            return workers.WORKER_POOL.recognizer(sample_rate)
+        except workers.WorkerError:
+            # No queda ningún proceso de decodificación vivo: seguimos en el proceso principal.
+            pass
+    return KaldiRecognizer(model, sample_rate)
+
+
+class RecognizerPool:
+    """Reconocedores libres agrupados por (modelo, frecuencia, opciones), listos para reutilizar."""
+
+    def __init__(self, max_idle=RECOGNIZER_POOL_MAX_IDLE, idle_seconds=RECOGNIZER_POOL_IDLE_SECONDS, factory=None,
+                 clock=time.monotonic):
+        self.max_idle = max_idle
+        self.idle_seconds = idle_seconds
+        self._factory = factory or create_recognizer
+        # Reloj con el que se mide el tiempo sin uso (las pruebas pasan uno propio).
+        self._clock = clock
+        # Para cada clave, una pila de (reconocedor, momento en que quedó libre).
+        self._idle = collections.defaultdict(collections.deque)
+        # Clave de cada reconocedor prestado, para saber a qué pila devolverlo.
+        self._keys = {}
+        self.hits = 0
+        self.misses = 0
+        self.discarded = 0
+        self.trimmed = 0
+        self._trimmer = None
+
+    def _create(self, model, key):
+        _, sample_rate, words = key
+        recognizer = self._factory(sample_rate, model.model)
+        if words:
+            recognizer.SetWords(True)
+        return recognizer
+
+    @property
+    def idle(self):
+        return sum(len(stack) for stack in self._idle.values())
+
+    async def prewarm(self, model, count, sample_rate, lane, words=False):
+        """Crea 'count' reconocedores libres de antemano para un modelo del registro.
+
+        Como en acquire, la creación se ejecuta en 'lane' y no en el event loop.
+        """
+        key = (model.name, sample_rate, words)
+        for _ in range(count):
+            recognizer = await lane.run(self._create, model, key)
+            self._idle[key].append((recognizer, self._clock()))
+
+    async def acquire(self, model, sample_rate, lane, words=False):
+        """Entrega un reconocedor listo para una nueva sesión (reutilizado o nuevo).
+
+        'model' es una entrada del registro de modelos ya cargada y 'lane' el carril del
+        ejecutor de decodificación de la sesión: la creación, Reset y SetWords se ejecutan
+        en él y no en el event loop (con DECODE_PROCESSES son llamadas por el pipe de un hijo).
+        """
+        started = time.perf_counter()
+        self.trim()
+        key = (model.name, sample_rate, words)
+        stack = self._idle[key]
+        recognizer = None
+        while stack and recognizer is None:
+            # El último en liberarse es el que tiene la memoria más "caliente".
+            recognizer, _ = stack.pop()
+            try:
+                # Borramos el estado de la sesión anterior antes de entregarlo.
+                await lane.run(recognizer.Reset)
+            except workers.WorkerError:
+                # Vivía en un proceso de decodificación que ya no existe: lo descartamos.
+                recognizer = None
+                self.discarded += 1
+        if recognizer is not None:
+            self.hits += 1
+            source = "pool"
+        else:
+            recognizer = await lane.run(self._create, model, key)
+            self.misses += 1
+            source = "new"
+        self._keys[id(recognizer)] = key
+        metrics.RECOGNIZER_ACQUIRE_SECONDS.labels(source).observe(time.perf_counter() - started)
+        return recognizer
+
+    def release(self, recognizer, reusable=True):
+        """Devuelve un reconocedor al pool.
+
+        Con reusable=False (p. ej. la sesión se canceló con una llamada a Kaldi en curso)
+        no se reutiliza: se descarta.
+        """
+        key = self._keys.pop(id(recognizer), None)
+        if key is None:
+            return
+        stack = self._idle[key]
+        if not reusable or len(stack) >= self.max_idle:
+            self.discarded += 1
+            return
+        stack.append((recognizer, self._clock()))
+
+    def drop(self, model_name):
+        """Suelta los reconocedores libres de un modelo (p. ej. al descargarlo de memoria)."""
+        for key in [key for key in self._idle if key[0] == model_name]:
+            self._idle.pop(key)
+
+    def trim(self):
+        """Libera los reconocedores que llevan demasiado tiempo sin usarse."""
+        deadline = self._clock() - self.idle_seconds
+        for stack in self._idle.values():
+            # Los más antiguos están al principio de la pila.
+            while stack and stack[0][1] < deadline:
+                stack.popleft()
+                self.trimmed += 1
+
+    def start(self):
+        """Recorta periódicamente los reconocedores sin uso, aunque no lleguen sesiones nuevas."""
+        async def trim_periodically():
+            while True:
+                await asyncio.sleep(min(self.idle_seconds, 60))
+                self.trim()
+
+        self._trimmer = asyncio.ensure_future(trim_periodically())
+
+    async def stop(self):
+        if self._trimmer is not None:
+            self._trimmer.cancel()
+            await asyncio.gather(self._trimmer, return_exceptions=True)
+            self._trimmer = None
+
+    def stats(self):
+        return {
+            "idle": self.idle,
+            "in_use": len(self._keys),
+            "hits": self.hits,
+            "misses": self.misses,
+            "discarded": self.discarded,
+            "trimmed": self.trimmed,
+        }
+
+
+def create_recognizer_pool():
+    """Crea el pool de reconocedores compartido."""
+    global RECOGNIZER_POOL
+    RECOGNIZER_POOL = RecognizerPool()
+    RECOGNIZER_POOL.start()
+
+
+async def stop_recognizer_pool():
+    global RECOGNIZER_POOL
+    if RECOGNIZER_POOL is not None:
+        await RECOGNIZER_POOL.stop()
+        RECOGNIZER_POOL = None
+
+
+async def prewarm_recognizers(model):
+    """Precalienta el pool con reconocedores de un modelo recién cargado."""
+    lane = decoder.DECODE_EXECUTOR.lane()
+    await RECOGNIZER_POOL.prewarm(model, RECOGNIZER_POOL_PREWARM, audio.PCM_SAMPLE_RATE, lane)
+    print(f"Pool de reconocedores precalentado con {RECOGNIZER_POOL_PREWARM} reconocedores de '{model.name}'.")
@@ -0,0 +1,122 @@
+import asyncio
+import collections
+import os
+import secrets
+from . import services
+from . import models
+
+# Sesiones reanudables de /ws/transcribe.
+# Si el cliente lo pide en el handshake ('resumable': true), recibe un token de sesión.
+# Cuando la conexión se corta sin 'eof', en lugar de cerrar la frase con FinalResult se
+# "aparca" la sesión (reconocedor, estado del audio y bytes ya procesados) durante un tiempo
+# de gracia. Si el cliente vuelve a conectarse con {"type": "resume", "session_id": ...},
+# continúa donde lo dejó: no reenvía el audio ya procesado ni se decodifica dos veces.
+
+# Segundos que se guarda una sesión cortada a la espera de que el cliente vuelva.
+RESUME_GRACE_SECONDS = float(os.environ.get("RESUME_GRACE_SECONDS", 30))
+# Máximo de sesiones aparcadas a la vez; al llegar al límite se descarta la más antigua.
+RESUME_MAX_SESSIONS = int(os.environ.get("RESUME_MAX_SESSIONS", 1000))
+
+# Variable global con la tabla de sesiones (se crea una sola vez al iniciar la aplicación).
+SESSION_TABLE = None
+
+
+class ParkedSession:
+    """Lo necesario para continuar un stream cortado."""
+
+    def __init__(self, token, session, model, encoding, offset, unsent):
+        self.token = token
+        # StreamSession con el reconocedor y el estado de remuestreo, VAD y codec.
+        self.session = session
+        # Modelo del registro (sigue contando como "en uso" mientras la sesión está aparcada).
+        self.model = model
+        self.encoding = encoding
+        # Bytes de audio del cliente ya procesados: el cliente debe reenviar a partir de aquí.
+        self.offset = offset
+        # Resultados que no se llegaron a enviar antes del corte.
+        self.unsent = unsent
+        self.timer = None
+
+
+class SessionTable:
+    """Sesiones aparcadas, limitadas en número y con caducidad."""
+
+    def __init__(self, grace_seconds=RESUME_GRACE_SECONDS, max_sessions=RESUME_MAX_SESSIONS):
+        self.grace_seconds = grace_seconds
+        self.max_sessions = max_sessions
+        # El orden de inserción permite descartar primero la sesión aparcada hace más tiempo.
+        self._parked = collections.OrderedDict()
+        self.parked = 0
+        self.resumed = 0
+        self.expired = 0
+        self.evicted = 0
+
+    def __len__(self):
+        return len(self._parked)
+
+    def new_token(self):
+        return secrets.token_urlsafe(16)
+
+    def park(self, parked):
+        """Guarda una sesión cortada durante el tiempo de gracia."""
+        while self._parked and len(self._parked) >= self.max_sessions:
+            _, oldest = self._parked.popitem(last=False)
+            self.evicted += 1
+            self._discard(oldest)
+        loop = asyncio.get_running_loop()
+        parked.timer = loop.call_later(self.grace_seconds, self._expire, parked.token)
+        self._parked[parked.token] = parked
+        self.parked += 1
+
+    def claim(self, token):
+        """Recupera una sesión aparcada para reanudarla. Devuelve None si no existe o ya caducó."""
+        if not isinstance(token, str):
+            return None
+        parked = self._parked.pop(token, None)
+        if parked is not None:
+            parked.timer.cancel()
+            self.resumed += 1
+        return parked
+
+    def _expire(self, token):
+        parked = self._parked.pop(token, None)
+        if parked is not None:
+            self.expired += 1
+            self._discard(parked)
+
+    def _discard(self, parked):
+        # Liberamos el reconocedor y el modelo. No hay llamadas a Kaldi en curso (la sesión
+        # se aparca entre bloques), así que el reconocedor vuelve al pool; se limpia con Reset.
+        parked.timer.cancel()
+        services.RECOGNIZER_POOL.release(parked.session.recognizer)
+        models.MODEL_REGISTRY.release(parked.model)
+
+    def close(self):
+        """Descarta todas las sesiones aparcadas (al apagar el servidor)."""
+        while self._parked:
+            _, parked = self._parked.popitem()
+            self._discard(parked)
+
+    def stats(self):
+        return {
+            "parked_now": len(self._parked),
+            "max_sessions": self.max_sessions,
+            "grace_seconds": self.grace_seconds,
+            "parked": self.parked,
+            "resumed": self.resumed,
+            "expired": self.expired,
+            "evicted": self.evicted,
+        }
+
+
+def create_session_table():
+    """Crea la tabla de sesiones reanudables compartida."""
+    global SESSION_TABLE
+    SESSION_TABLE = SessionTable()
+
+
+def close_session_table():
+    global SESSION_TABLE
+    if SESSION_TABLE is not None:
+        SESSION_TABLE.close()
+        SESSION_TABLE = None
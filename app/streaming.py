@@ -0,0 +1,134 @@
+import json
+import time
+from . import services
+from . import audio
+from . import metrics
+
+# 'msgpack' es opcional: solo se necesita si el cliente pide mensajes binarios.
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+# Estado y procesamiento de audio de una conexión de /ws/transcribe.
+# El endpoint (en 'main') se encarga del protocolo (handshake, mensajes, cierre) y delega
+# aquí todo lo que tiene que ver con el audio: etapas previas (decodificación, remuestreo, VAD)
+# y llamadas a Vosk.
+
+# Políticas para los resultados parciales:
+#   - "always": un 'partial' después de cada bloque de audio (comportamiento original).
+#   - "changed": solo cuando el texto parcial cambia.
+#   - "none": no se envían parciales (ni se le piden a Vosk).
+PARTIAL_POLICIES = ["always", "changed", "none"]
+# Codificación de los mensajes que el servidor envía al cliente.
+MESSAGE_ENCODINGS = ["json", "msgpack"]
+
+
+def stream_options_from_handshake(handshake):
+    """Lee y valida las opciones de envío de resultados del handshake."""
+    partials = handshake.get("partials", "always")
+    if partials not in PARTIAL_POLICIES:
+        raise ValueError(f"Invalid 'partials' policy. Supported policies are: {PARTIAL_POLICIES}")
+    interval = handshake.get("partial_interval_ms", 0)
+    if not isinstance(interval, (int, float)) or interval < 0:
+        raise ValueError("Invalid 'partial_interval_ms'. It must be a number of milliseconds >= 0.")
+    encoding = handshake.get("message_encoding", "json")
+    if encoding not in MESSAGE_ENCODINGS:
+        raise ValueError(f"Invalid 'message_encoding'. Supported encodings are: {MESSAGE_ENCODINGS}")
+    if encoding == "msgpack" and msgpack is None:
+        raise ValueError("The 'msgpack' message encoding is not available on this server.")
+    return {"partials": partials, "partial_interval": interval / 1000, "encoding": encoding}
+
+
+async def send_message(websocket, message, encoding="json"):
+    """Envía un mensaje al cliente como JSON (texto) o msgpack (binario)."""
+    started = time.perf_counter()
+    if encoding == "msgpack":
+        payload = msgpack.packb(message)
+        await websocket.send_bytes(payload)
+    else:
+        payload = json.dumps(message, ensure_ascii=False, separators=(",", ":"))
+        await websocket.send_text(payload)
+    metrics.SEND_SECONDS.labels(message.get("type", "")).observe(time.perf_counter() - started)
+    metrics.BYTES.labels("ws", "out").inc(len(payload))
+
+class StreamSession:
+    """Reconocedor, carril del ejecutor y etapas de preprocesamiento de un stream."""
+
+    def __init__(self, recognizer, lane, resampler=None, vad=None, partials="always", partial_interval=0, codec=None):
+        self.recognizer = recognizer
+        self.lane = lane
+        self.codec = codec
+        self.resampler = resampler
+        self.vad = vad
+        self.partials = partials
+        self.partial_interval = partial_interval
+        self._last_partial = None
+        self._last_partial_at = 0.0
+        # Duración del audio recibido y tiempo de Kaldi, para el factor de tiempo real del stream.
+        self.audio_seconds = 0.0
+        # True cuando la sesión terminó limpiamente y el reconocedor se puede reutilizar.
+        self.finished = False
+        self.decode_seconds = 0.0
+
+    async def _partial_message(self):
+        # Devuelve el mensaje 'partial' a enviar, o None si la política indica que no toca.
+        if self.partials == "none":
+            return None
+        now = time.monotonic()
+        if self.partial_interval and now - self._last_partial_at < self.partial_interval:
+            # Todavía no pasó el intervalo mínimo: ni siquiera le pedimos el parcial a Vosk.
+            return None
+        raw = await self.lane.run(self.recognizer.PartialResult)
+        if self.partials == "changed" and raw == self._last_partial:
+            # Comparamos el JSON sin parsear: si no cambió, no hay nada que enviar.
+            return None
+        self._last_partial = raw
+        self._last_partial_at = now
+        return {"type": "partial", "text": json.loads(raw).get("partial", "")}
+
+    async def accept_audio(self, chunk):
+        """Procesa un bloque de audio y devuelve la lista de mensajes a enviar al cliente."""
+        messages = []
+        force_final = False
+        if self.codec is not None:
+            # Si el cliente envía audio comprimido (G.711, Opus), lo pasamos a PCM s16le.
+            chunk = self.codec.decode(chunk)
+        if self.resampler is not None:
+            # Convertimos el audio del cliente a 16 kHz mono, conservando el estado entre bloques.
+            chunk = self.resampler.process(chunk)
+        self.audio_seconds += len(chunk) / (audio.PCM_SAMPLE_RATE * audio.PCM_SAMPLE_WIDTH)
+        if self.vad is not None:
+            # Solo los tramos con voz llegan a Kaldi; el silencio se descarta.
+            chunk, force_final = self.vad.process(chunk)
+
+        if chunk:
+            accepted, elapsed = await self.lane.run(services.accept_waveform, self.recognizer, chunk)
+            self.decode_seconds += elapsed
+            if accepted:
+                # Si Vosk reconoce una frase completa, enviamos el resultado 'final'.
+                result = json.loads(await self.lane.run(self.recognizer.Result))
+                messages.append({"type": "final", "text": result.get("text", "")})
+                self._last_partial = None
+            else:
+                # Si no ha reconocido una frase completa, enviamos un resultado 'partial' (parcial)
+                # según la política elegida por el cliente.
+                partial = await self._partial_message()
+                if partial is not None:
+                    messages.append(partial)
+
+        if force_final:
+            # El VAD detectó un silencio largo después de la voz: cerramos la frase.
+            result = json.loads(await self.lane.run(self.recognizer.FinalResult))
+            if result.get("text"):
+                messages.append({"type": "final", "text": result["text"]})
+            self._last_partial = None
+        return messages
+
+    async def finish(self):
+        """Obtiene el último resultado final del reconocedor."""
+        if self.audio_seconds > 0:
+            metrics.STREAM_RTF.observe(self.decode_seconds / self.audio_seconds)
+        final_result = json.loads(await self.lane.run(self.recognizer.FinalResult))
+        self.finished = True
+        return {"type": "final", "text": final_result.get("text", "")}
@@ -0,0 +1,340 @@
+import asyncio
+import json
+import mmap
+import tempfile
+import time
+import numpy as np
+from . import services
+from . import decoder
+from . import audio
+from . import cache
+from . import models
+from . import metrics
+
+# Lógica de transcripción de archivos, separada del endpoint para poder reutilizarla.
+# El audio llega como bloques PCM (ver 'audio.ffmpeg_pcm_chunks') y se entrega al
+# reconocedor de Vosk a medida que FFmpeg lo produce.
+
+async def iter_results(chunks, recognizer, lane):
+    """Alimenta el reconocedor con los bloques PCM y produce cada resultado final de Vosk."""
+    try:
+        async for chunk in chunks:
+            # AcceptWaveform devuelve True cuando Vosk detecta el final de una frase.
+            accepted, _ = await lane.run(services.accept_waveform, recognizer, chunk)
+            if accepted:
+                yield json.loads(await lane.run(recognizer.Result))
+    finally:
+        # Si la transcripción se cancela, cerramos la fuente en el momento (p. ej. para terminar FFmpeg).
+        await chunks.aclose()
+    # Al terminar el audio, obtenemos lo que quede pendiente en el reconocedor.
+    yield json.loads(await lane.run(recognizer.FinalResult))
+
+
+def _observe_rtf(started, pcm_bytes):
+    # Factor de tiempo real del archivo: tiempo total / duración del audio.
+    seconds = pcm_bytes / (audio.PCM_SAMPLE_RATE * audio.PCM_SAMPLE_WIDTH)
+    if seconds > 0:
+        metrics.JOB_RTF.observe((time.perf_counter() - started) / seconds)
+
+
+async def transcribe_upload(source, model):
+    """Transcribe un archivo de audio en cualquier formato soportado por FFmpeg."""
+    started = time.perf_counter()
+    lane = decoder.DECODE_EXECUTOR.lane()
+    recognizer = await services.RECOGNIZER_POOL.acquire(model, audio.PCM_SAMPLE_RATE, lane)
+    pcm_bytes = 0
+
+    async def counted_chunks():
+        # Contamos el PCM producido para calcular la duración del audio.
+        nonlocal pcm_bytes
+        async for chunk in audio.upload_pcm_chunks(source):
+            pcm_bytes += len(chunk)
+            yield chunk
+
+    texts = []
+    reusable = False
+    try:
+        async for result in iter_results(counted_chunks(), recognizer, lane):
+            # Juntamos el texto de todas las frases reconocidas.
+            if result.get("text"):
+                texts.append(result["text"])
+        reusable = True
+    finally:
+        # Si la transcripción falló o se canceló, el reconocedor no vuelve al pool.
+        services.RECOGNIZER_POOL.release(recognizer, reusable)
+    _observe_rtf(started, pcm_bytes)
+    return {"text": " ".join(texts)}
+
+# ----------------------------------------------------------------------
+## Respuesta incremental (NDJSON / Server-Sent Events)
+# ----------------------------------------------------------------------
+
+def _segment(result):
+    # Convierte un resultado de Vosk (con tiempos por palabra) en un segmento de la respuesta.
+    words = result.get("result", [])
+    return {
+        "text": result.get("text", ""),
+        "start": words[0]["start"] if words else None,
+        "end": words[-1]["end"] if words else None,
+        "words": words,
+    }
+
+
+async def stream_segments(source, model=None):
+    """Produce cada frase reconocida (con los tiempos de sus palabras) en cuanto Vosk la termina.
+
+    La conversión, la decodificación y el envío al cliente se solapan: no hay que esperar
+    al final del archivo para recibir el primer segmento. Al terminar produce un mensaje
+    'done' con el texto completo.
+    """
+    started = time.perf_counter()
+    entry = await models.MODEL_REGISTRY.acquire(model)
+    lane = decoder.DECODE_EXECUTOR.lane()
+    try:
+        recognizer = await services.RECOGNIZER_POOL.acquire(entry, audio.PCM_SAMPLE_RATE, lane, words=True)
+    except BaseException:
+        models.MODEL_REGISTRY.release(entry)
+        raise
+    pcm_bytes = 0
+
+    async def counted_chunks():
+        nonlocal pcm_bytes
+        async for chunk in audio.upload_pcm_chunks(source):
+            pcm_bytes += len(chunk)
+            yield chunk
+
+    texts = []
+    reusable = False
+    results = iter_results(counted_chunks(), recognizer, lane)
+    try:
+        async for result in results:
+            if result.get("text"):
+                texts.append(result["text"])
+                yield {"type": "final", **_segment(result)}
+        reusable = True
+    finally:
+        # Si el cliente se va a mitad, cerramos también la fuente (p. ej. para terminar FFmpeg).
+        await results.aclose()
+        services.RECOGNIZER_POOL.release(recognizer, reusable)
+        models.MODEL_REGISTRY.release(entry)
+    _observe_rtf(started, pcm_bytes)
+    yield {"type": "done", "text": " ".join(texts)}
+
+# ----------------------------------------------------------------------
+## Modo paralelo para archivos largos
+# ----------------------------------------------------------------------
+
+async def _pcm_slices(pcm, start, end):
+    # Produce bloques de 'pcm' (mmap o memoryview) entre dos posiciones en bytes.
+    for offset in range(start, end, audio.PCM_CHUNK_SIZE):
+        yield bytes(pcm[offset:min(offset + audio.PCM_CHUNK_SIZE, end)])
+
+
+async def _decode_segment(pcm, start, end, limit, model):
+    # Decodifica un segmento con su propio reconocedor y desplaza los tiempos
+    # de las palabras para que sean relativos al inicio del archivo.
+    offset = start / audio.PCM_SAMPLE_RATE
+    async with limit:
+        # Reconocedor con tiempos por palabra (SetWords), del pool.
+        lane = decoder.DECODE_EXECUTOR.lane()
+        recognizer = await services.RECOGNIZER_POOL.acquire(model, audio.PCM_SAMPLE_RATE, lane, words=True)
+        texts = []
+        words = []
+        byte_range = (start * audio.PCM_SAMPLE_WIDTH, end * audio.PCM_SAMPLE_WIDTH)
+        reusable = False
+        try:
+            async for result in iter_results(_pcm_slices(pcm, *byte_range), recognizer, lane):
+                if result.get("text"):
+                    texts.append(result["text"])
+                for word in result.get("result", []):
+                    words.append(dict(word, start=round(word["start"] + offset, 3), end=round(word["end"] + offset, 3)))
+            reusable = True
+        finally:
+            services.RECOGNIZER_POOL.release(recognizer, reusable)
+    return {
+        "start": round(offset, 3),
+        "end": round(end / audio.PCM_SAMPLE_RATE, 3),
+        "text": " ".join(texts),
+        "words": words,
+    }
+
+
+async def _decode_segments(pcm, size, model):
+    # Divide el PCM en los silencios y decodifica los segmentos en paralelo.
+    loop = asyncio.get_running_loop()
+    # Buscamos los silencios con NumPy (en un hilo, para no bloquear el event loop).
+    cuts = await loop.run_in_executor(None, audio.find_silence_cuts, pcm)
+    bounds = audio.segment_bounds(size // audio.PCM_SAMPLE_WIDTH, cuts)
+    # Decodificamos los segmentos a la vez, como máximo uno por hilo del ejecutor.
+    limit = asyncio.Semaphore(decoder.DECODE_EXECUTOR.workers)
+    tasks = [asyncio.ensure_future(_decode_segment(pcm, start, end, limit, model)) for start, end in bounds]
+    try:
+        return await asyncio.gather(*tasks)
+    finally:
+        # Si un segmento falla, cancelamos y esperamos al resto antes de soltar 'pcm' (mmap o
+        # memoryview): ninguna llamada a Kaldi puede seguir leyendo un buffer ya liberado.
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+
+async def transcribe_upload_parallel(source, model):
+    """Transcribe un archivo largo dividiéndolo en los silencios y decodificando los segmentos en paralelo."""
+    started = time.perf_counter()
+    wav = audio.sniff_pcm_wav(source)
+    if wav is not None:
+        # 1a. El archivo ya es PCM 16 kHz mono: trabajamos directamente sobre sus datos, sin FFmpeg.
+        metrics.UPLOAD_DECODE_PATH.labels("wav").inc()
+        size = wav[1]
+        if size == 0:
+            return {"text": "", "segments": []}
+        with audio.pcm_view(source, *wav) as pcm:
+            segments = await _decode_segments(pcm, size, model)
+    else:
+        # 1b. Convertimos a PCM en un archivo temporal anónimo (sin cargar todo el audio en memoria).
+        metrics.UPLOAD_DECODE_PATH.labels("ffmpeg").inc()
+        loop = asyncio.get_running_loop()
+        with tempfile.TemporaryFile() as pcm_file:
+            # Las escrituras en disco se hacen en un hilo (en bloques grandes) para no bloquear
+            # el event loop, que sigue atendiendo los streams en tiempo real.
+            async for chunk in audio.ffmpeg_pcm_chunks(source, audio.UPLOAD_READ_SIZE):
+                await loop.run_in_executor(None, pcm_file.write, chunk)
+            await loop.run_in_executor(None, pcm_file.flush)
+            size = pcm_file.tell() - pcm_file.tell() % audio.PCM_SAMPLE_WIDTH
+            if size == 0:
+                return {"text": "", "segments": []}
+            with mmap.mmap(pcm_file.fileno(), 0, access=mmap.ACCESS_READ) as pcm:
+                segments = await _decode_segments(pcm, size, model)
+
+    _observe_rtf(started, size)
+    # Unimos los resultados en orden; 'gather' conserva el orden de los segmentos.
+    return {
+        "text": " ".join(segment["text"] for segment in segments if segment["text"]),
+        "segments": segments,
+    }
+
+
+# ----------------------------------------------------------------------
+## Modo multicanal (un reconocedor por canal)
+# ----------------------------------------------------------------------
+
+# Bloques pendientes por canal: si un canal va retrasado, se deja de leer el archivo.
+CHANNEL_QUEUE_SIZE = 8
+
+
+async def _channel_chunks(queue):
+    # Produce los bloques de un canal hasta la marca de fin (None).
+    while True:
+        chunk = await queue.get()
+        if chunk is None:
+            return
+        yield chunk
+
+
+async def _decode_channel(channel, queue, model):
+    # Decodifica un canal con su propio reconocedor y su propio carril del ejecutor.
+    lane = decoder.DECODE_EXECUTOR.lane()
+    recognizer = await services.RECOGNIZER_POOL.acquire(model, audio.PCM_SAMPLE_RATE, lane, words=True)
+    texts = []
+    segments = []
+    reusable = False
+    try:
+        async for result in iter_results(_channel_chunks(queue), recognizer, lane):
+            if result.get("text"):
+                texts.append(result["text"])
+                segments.append(dict(_segment(result), channel=channel))
+        reusable = True
+    finally:
+        services.RECOGNIZER_POOL.release(recognizer, reusable)
+    return " ".join(texts), segments
+
+
+async def transcribe_upload_multichannel(source, model):
+    """Transcribe cada canal de un archivo por separado y en paralelo.
+
+    Pensado para grabaciones con un hablante por canal (llamadas, entrevistas): en lugar de
+    mezclar los canales a mono, cada uno se decodifica con su propio reconocedor y los
+    segmentos se devuelven juntos, ordenados por tiempo y con el canal al que pertenecen.
+    """
+    started = time.perf_counter()
+    channels = await audio.probe_channels(source)
+    if not 1 <= channels <= audio.MAX_CHANNELS:
+        raise audio.ConversionError(f"Unsupported number of channels: {channels} (maximum {audio.MAX_CHANNELS}).")
+    queues = [asyncio.Queue(CHANNEL_QUEUE_SIZE) for _ in range(channels)]
+    pcm_bytes = 0
+
+    async def demux():
+        # Una sola conversión (o lectura directa del WAV) con los canales intercalados;
+        # cada bloque se separa por canales con NumPy y se reparte a su cola.
+        nonlocal pcm_bytes
+        chunks = audio.upload_pcm_chunks(source, channels=channels)
+        try:
+            async for chunk in chunks:
+                samples = np.frombuffer(chunk, dtype="<i2")
+                frames = samples[:len(samples) - len(samples) % channels].reshape(-1, channels)
+                pcm_bytes += frames.shape[0] * audio.PCM_SAMPLE_WIDTH
+                for channel, queue in enumerate(queues):
+                    await queue.put(frames[:, channel].tobytes())
+        finally:
+            await chunks.aclose()
+        for queue in queues:
+            await queue.put(None)
+
+    tasks = [asyncio.ensure_future(demux())]
+    tasks.extend(asyncio.ensure_future(_decode_channel(channel, queue, model)) for channel, queue in enumerate(queues))
+    try:
+        results = await asyncio.gather(*tasks)
+    finally:
+        # Si algo falla (p. ej. FFmpeg), el resto de tareas se cancelan en lugar de quedarse esperando.
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    _observe_rtf(started, pcm_bytes)
+    texts = [text for text, _ in results[1:]]
+    segments = [segment for _, channel_segments in results[1:] for segment in channel_segments]
+    # Línea de tiempo común: los segmentos de todos los canales, ordenados por su inicio.
+    segments.sort(key=lambda segment: (segment["start"] or 0, segment["channel"]))
+    return {
+        "text": " ".join(segment["text"] for segment in segments),
+        "channels": texts,
+        "segments": segments,
+    }
+
+
+async def transcribe(source, parallel=False, model=None, multichannel=False):
+    """Transcribe un archivo pasando primero por la caché de resultados.
+
+    'model' es el nombre de un modelo del registro (None = el modelo por defecto).
+    """
+    loop = asyncio.get_running_loop()
+    entry = models.MODEL_REGISTRY.get(model)
+    # Si ya transcribimos este mismo archivo (con el mismo modelo y opciones), devolvemos
+    # el resultado guardado sin ejecutar FFmpeg ni Vosk (ni cargar el modelo). El hash se calcula en un hilo.
+    key = await loop.run_in_executor(
+        None, cache.cache_key, source, services.model_identity(entry.path),
+        {"parallel": parallel, "multichannel": multichannel},
+    )
+    cached = await loop.run_in_executor(None, cache.TRANSCRIPTION_CACHE.get, key)
+    if cached is not None:
+        return cached
+
+    # Mientras dure la transcripción el modelo cuenta como "en uso" y no se descarga.
+    entry = await models.MODEL_REGISTRY.acquire(entry.name)
+    try:
+        if parallel:
+            # Modo para archivos largos: se divide el audio en los silencios, los segmentos se
+            # decodifican en paralelo y se devuelven con sus tiempos y los de cada palabra.
+            result = await transcribe_upload_parallel(source, entry)
+        elif multichannel:
+            # Grabaciones con un hablante por canal: cada canal se decodifica por separado.
+            result = await transcribe_upload_multichannel(source, entry)
+        else:
+            # El archivo se envía a FFmpeg por un pipe y el PCM resultante se entrega
+            # a Vosk por bloques mientras se convierte: sin archivos temporales ni lecturas completas.
+            result = await transcribe_upload(source, entry)
+    finally:
+        models.MODEL_REGISTRY.release(entry)
+
+    await loop.run_in_executor(None, cache.TRANSCRIPTION_CACHE.put, key, result)
+    return result
@@ -0,0 +1,103 @@
+import collections
+import numpy as np
+
+# Detector de actividad de voz (VAD) para los streams de /ws/transcribe.
+# Clasifica el audio en frames cortos usando energía (RMS) y tasa de cruces por cero,
+# calculadas con NumPy. Solo los frames con voz (más un poco de contexto antes y después)
+# llegan a Kaldi; el silencio y el ruido de línea se descartan y no consumen CPU.
+
+# Valores por defecto; cada cliente puede cambiarlos en el handshake ('vad': {...}).
+VAD_DEFAULTS = {
+    "frame_ms": 20,
+    # Audio que se conserva antes del inicio de la voz para no cortar la primera sílaba.
+    "preroll_ms": 300,
+    # Silencio que se sigue enviando a Kaldi tras la voz (le ayuda a cerrar la frase).
+    "hangover_ms": 300,
+    # Silencio tras la voz después del cual se fuerza un resultado 'final'.
+    "final_silence_ms": 800,
+    # Energía RMS mínima de un frame con voz (muestras s16le).
+    "energy_threshold": 300,
+    # Proporción máxima de cruces por cero de un frame con voz de energía moderada.
+    "zcr_threshold": 0.35,
+}
+
+
+class VoiceActivityGate:
+    """Filtra el audio de un stream dejando pasar solo los tramos con voz."""
+
+    def __init__(self, sample_rate=16000, **options):
+        config = dict(VAD_DEFAULTS, **options)
+        frame_ms = int(config["frame_ms"])
+        self.frame_bytes = sample_rate * frame_ms // 1000 * 2
+        self.hangover_frames = int(config["hangover_ms"] // frame_ms)
+        self.final_silence_frames = max(1, int(config["final_silence_ms"] // frame_ms))
+        self.energy_threshold = config["energy_threshold"]
+        self.zcr_threshold = config["zcr_threshold"]
+        self._preroll = collections.deque(maxlen=max(1, int(config["preroll_ms"] // frame_ms)))
+        self._pending = b""
+        self._in_speech = False
+        self._speech_since_final = False
+        self._silent_frames = 0
+        # Contadores para saber cuánto audio se ahorra.
+        self.frames_total = 0
+        self.frames_passed = 0
+
+    def _classify(self, data):
+        # Devuelve un array booleano (voz / no voz) para todos los frames del bloque.
+        samples = np.frombuffer(data, dtype="<i2").reshape(-1, self.frame_bytes // 2).astype(np.float32)
+        energy = np.sqrt(np.mean(samples * samples, axis=1))
+        signs = np.signbit(samples)
+        zcr = np.mean(signs[:, 1:] != signs[:, :-1], axis=1)
+        # Voz: energía suficiente y pocos cruces por cero (el ruido de línea tiene muchos),
+        # salvo que la energía sea muy alta (consonantes fricativas como la 's').
+        return (energy >= self.energy_threshold) & ((zcr <= self.zcr_threshold) | (energy >= 2 * self.energy_threshold))
+
+    def process(self, chunk):
+        """Procesa un bloque de audio. Devuelve (audio_para_kaldi, forzar_final)."""
+        data = self._pending + chunk
+        usable = len(data) - len(data) % self.frame_bytes
+        self._pending = data[usable:]
+        if usable == 0:
+            return b"", False
+
+        passed = []
+        force_final = False
+        for i, speech in enumerate(self._classify(data[:usable]).tolist()):
+            frame = data[i * self.frame_bytes:(i + 1) * self.frame_bytes]
+            self.frames_total += 1
+            if speech:
+                if not self._in_speech:
+                    # Empieza la voz: enviamos antes el contexto previo guardado.
+                    passed.extend(self._preroll)
+                    self._preroll.clear()
+                    self._in_speech = True
+                passed.append(frame)
+                self._silent_frames = 0
+                self._speech_since_final = True
+                continue
+
+            self._silent_frames += 1
+            if self._in_speech and self._silent_frames <= self.hangover_frames:
+                passed.append(frame)
+            else:
+                self._in_speech = False
+                self._preroll.append(frame)
+            if self._speech_since_final and self._silent_frames >= self.final_silence_frames:
+                force_final = True
+                self._speech_since_final = False
+
+        self.frames_passed += len(passed)
+        return b"".join(passed), force_final
+
+
+def gate_from_handshake(value, sample_rate=16000):
+    """Crea el VAD a partir del campo 'vad' del handshake (True o un objeto con opciones)."""
+    if not value:
+        return None
+    if value is True:
+        return VoiceActivityGate(sample_rate)
+    if isinstance(value, dict):
+        options = {key: value[key] for key in VAD_DEFAULTS if key in value}
+        if all(isinstance(v, (int, float)) and v >= 0 for v in options.values()) and options.get("frame_ms", 1) >= 1:
+            return VoiceActivityGate(sample_rate, **options)
+    raise ValueError("Invalid 'vad' options. Use true or an object with numeric fields: " + ", ".join(VAD_DEFAULTS))
@@ -0,0 +1,209 @@
+import collections
+import itertools
+import multiprocessing
+import os
+import signal
+import threading
+import weakref
+from vosk import KaldiRecognizer
+
+# Modo de "procesos de decodificación": el modelo de Vosk se carga UNA vez en el proceso
+# principal y después se crean N procesos hijos con fork(). Los hijos comparten las páginas
+# de memoria del modelo (copy-on-write), así que usar más núcleos no multiplica la RAM.
+# La API (FastAPI) sigue en el proceso principal y envía el audio a los hijos por pipes.
+
+# Número de procesos de decodificación. Con 0 (valor por defecto) todo se decodifica
+# en el propio proceso del servidor, como antes.
+DECODE_PROCESSES = int(os.environ.get("DECODE_PROCESSES", 0))
+
+# Variable global con el pool de procesos (se crea una sola vez al iniciar la aplicación).
+WORKER_POOL = None
+
+
+class WorkerError(Exception):
+    """Error producido dentro de un proceso de decodificación."""
+
+
+def _worker_main(conn, model):
+    # Bucle principal de cada proceso hijo. Recibe comandos por el pipe y los ejecuta
+    # sobre los reconocedores de las sesiones que tiene asignadas.
+    # El proceso principal se encarga de detenernos, así que ignoramos Ctrl+C.
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    recognizers = {}
+    while True:
+        try:
+            command, session_id, args = conn.recv()
+        except EOFError:
+            # El proceso principal cerró el pipe: terminamos.
+            break
+        if command == "stop":
+            break
+        if command == "close":
+            # 'close' no tiene respuesta: solo liberamos el reconocedor.
+            recognizers.pop(session_id, None)
+            continue
+        try:
+            if command == "open":
+                recognizers[session_id] = KaldiRecognizer(model, *args)
+                result = None
+            else:
+                # Cualquier otro comando es un método de KaldiRecognizer (AcceptWaveform, Result...).
+                result = getattr(recognizers[session_id], command)(*args)
+            conn.send((True, result))
+        except Exception as e:
+            conn.send((False, repr(e)))
+
+
+class WorkerProcess:
+    """Un proceso hijo de decodificación y el extremo del pipe para hablar con él."""
+
+    def __init__(self, context, model, index, sessions_lock):
+        parent_conn, child_conn = context.Pipe()
+        self.process = context.Process(
+            target=_worker_main, args=(child_conn, model),
+            name=f"decode-worker-{index}", daemon=True,
+        )
+        self.process.start()
+        child_conn.close()
+        self._conn = parent_conn
+        # Un solo hilo a la vez puede hacer una petición/respuesta por el pipe.
+        self._lock = threading.Lock()
+        # Sesiones liberadas pendientes de avisar al hijo (se envían en la siguiente llamada).
+        self._closed = collections.deque()
+        self.sessions = 0
+        # Lock del pool que protege el contador de sesiones (ver 'WorkerPool').
+        self._sessions_lock = sessions_lock
+
+    def call(self, command, session_id, *args):
+        """Ejecuta un comando en el proceso hijo y espera su respuesta (bloqueante)."""
+        with self._lock:
+            try:
+                while self._closed:
+                    self._conn.send(("close", self._closed.popleft(), ()))
+                self._conn.send((command, session_id, args))
+                ok, result = self._conn.recv()
+            except (EOFError, OSError) as e:
+                raise WorkerError(f"Decode worker {self.process.name} is not available: {e}")
+        if not ok:
+            raise WorkerError(result)
+        return result
+
+    def release(self, session_id):
+        # Se llama cuando el reconocedor remoto deja de usarse. No bloquea: el aviso
+        # se envía junto con la siguiente llamada a este proceso.
+        with self._sessions_lock:
+            self.sessions -= 1
+        self._closed.append(session_id)
+
+    def stop(self):
+        # Avisamos explícitamente: los hijos heredan copias de los pipes de sus hermanos,
+        # así que no podemos depender de que el hijo vea el cierre del pipe (EOF).
+        with self._lock:
+            try:
+                self._conn.send(("stop", None, ()))
+            except OSError:
+                pass
+            self._conn.close()
+        self.process.join(timeout=5)
+        if self.process.is_alive():
+            self.process.terminate()
+
+
+class RemoteRecognizer:
+    """Reconocedor que vive en un proceso hijo; ofrece los mismos métodos que KaldiRecognizer."""
+
+    _ids = itertools.count()
+
+    def __init__(self, worker, *args):
+        self._worker = worker
+        self._session_id = next(self._ids)
+        self._args = args
+        self._opened = False
+        # Cuando el objeto se destruye, el reconocedor del hijo se libera automáticamente.
+        weakref.finalize(self, worker.release, self._session_id)
+
+    def _call(self, command, *args):
+        # El reconocedor se crea en el hijo con la primera llamada, que ya se ejecuta
+        # en un hilo del ejecutor de decodificación y no en el event loop.
+        if not self._opened:
+            self._worker.call("open", self._session_id, *self._args)
+            self._opened = True
+        return self._worker.call(command, self._session_id, *args)
+
+    def AcceptWaveform(self, data):
+        return self._call("AcceptWaveform", bytes(data))
+
+    def Result(self):
+        return self._call("Result")
+
+    def PartialResult(self):
+        return self._call("PartialResult")
+
+    def FinalResult(self):
+        return self._call("FinalResult")
+
+    def SetWords(self, enable):
+        return self._call("SetWords", enable)
+
+    def Reset(self):
+        return self._call("Reset")
+
+
+class WorkerPool:
+    """Conjunto de procesos de decodificación que comparten el modelo cargado por el padre."""
+
+    def __init__(self, model, processes):
+        context = multiprocessing.get_context("fork")
+        self.model = model
+        # Los reconocedores se crean desde los hilos del ejecutor de decodificación, a la vez:
+        # el lock protege la lista de procesos y los contadores de sesiones. Es reentrante porque
+        # el recolector de basura puede liberar un reconocedor (y restar su sesión) con el lock tomado.
+        self._lock = threading.RLock()
+        self.workers = [WorkerProcess(context, model, i, self._lock) for i in range(processes)]
+
+    def _remove_dead(self):
+        # Retira de la rotación los procesos que murieron (p. ej. los mató el sistema por falta
+        # de memoria). No se vuelven a crear: hacer fork() con los hilos del ejecutor ya en marcha
+        # no es seguro. Sus sesiones fallan con WorkerError; las nuevas van a los que quedan.
+        for worker in [w for w in self.workers if not w.process.is_alive()]:
+            self.workers.remove(worker)
+            print(f"El proceso de decodificación {worker.process.name} terminó (código {worker.process.exitcode}); se retira.")
+
+    def recognizer(self, *args):
+        """Crea un reconocedor remoto en el proceso vivo con menos sesiones activas.
+
+        El reconocedor queda fijo en ese proceso durante toda su vida (afinidad de sesión).
+        Lanza WorkerError si no queda ningún proceso vivo.
+        """
+        with self._lock:
+            self._remove_dead()
+            if not self.workers:
+                raise WorkerError("No decode workers are available.")
+            worker = min(self.workers, key=lambda w: w.sessions)
+            worker.sessions += 1
+        return RemoteRecognizer(worker, *args)
+
+    def stop(self):
+        for worker in self.workers:
+            worker.stop()
+
+
+def start_worker_pool(model, processes=DECODE_PROCESSES):
+    """Crea los procesos de decodificación si el modo está activado."""
+    global WORKER_POOL
+    if processes <= 0:
+        return
+    if "fork" not in multiprocessing.get_all_start_methods():
+        print("Los procesos de decodificación requieren fork(); se decodificará en el proceso principal.")
+        return
+    WORKER_POOL = WorkerPool(model, processes)
+    print(f"Iniciados {processes} procesos de decodificación que comparten el modelo.")
+
+
+def stop_worker_pool():
+    """Detiene los procesos de decodificación."""
+    global WORKER_POOL
+    if WORKER_POOL is not None:
+        WORKER_POOL.stop()
+        WORKER_POOL = None
@@ -0,0 +1,295 @@
+import argparse
+import asyncio
+import glob
+import json
+import os
+import statistics
+import subprocess
+import time
+import wave
+
+import httpx
+import websockets
+
+# Benchmark de carga: reproduce los audios de 'samples/' sobre muchos WebSockets a la vez
+# y sube archivos a /transcribe en paralelo para medir cuántos streams aguanta el servidor.
+# Mide la latencia del primer parcial, la latencia del resultado final tras 'eof',
+# los percentiles p50/p95/p99, el factor de tiempo real agregado y la CPU/RSS del servidor.
+# Los resultados se guardan en JSON para poder comparar ejecuciones entre commits.
+#
+# Ejemplo:
+#   python benchmark.py --streams 20 --uploads 8 --speed 2 --server-pid $(pgrep -f uvicorn) --output bench.json
+
+BYTES_PER_SAMPLE = 2
+
+
+def load_sample(path):
+    """Lee un audio de 'samples/' como PCM. Devuelve (pcm, sample_rate, channels) o None."""
+    if path.endswith(".wav"):
+        try:
+            with wave.open(path, "rb") as wav:
+                if wav.getsampwidth() != BYTES_PER_SAMPLE:
+                    return None
+                return wav.readframes(wav.getnframes()), wav.getframerate(), wav.getnchannels()
+        except wave.Error:
+            # No es un WAV PCM (p. ej. otro contenedor con extensión .wav): solo sirve para /transcribe.
+            return None
+    # Los .pcm de 'samples/' son PCM 16 bits, 16 kHz, mono.
+    with open(path, "rb") as pcm_file:
+        return pcm_file.read(), 16000, 1
+
+
+def audio_seconds(sample):
+    pcm, sample_rate, channels = sample
+    return len(pcm) / (sample_rate * channels * BYTES_PER_SAMPLE)
+
+
+def percentiles(values):
+    """Resumen de una lista de latencias en segundos."""
+    if not values:
+        return None
+    ordered = sorted(values)
+
+    def pick(p):
+        return ordered[min(len(ordered) - 1, int(round(p / 100 * (len(ordered) - 1))))]
+
+    return {
+        "count": len(ordered),
+        "mean": statistics.fmean(ordered),
+        "p50": pick(50),
+        "p95": pick(95),
+        "p99": pick(99),
+        "max": ordered[-1],
+    }
+
+# ----------------------------------------------------------------------
+## CPU y memoria del servidor
+# ----------------------------------------------------------------------
+
+class ProcessSampler:
+    """Muestrea la CPU y la RSS de un proceso (y sus hijos) leyendo /proc (solo Linux)."""
+
+    def __init__(self, pid, interval=0.5):
+        self.pid = pid
+        self.interval = interval
+        self.rss_samples = []
+        self._cpu_start = None
+        self._cpu_end = None
+        self._task = None
+
+    def _pids(self):
+        # Incluye los procesos hijos (p. ej. los workers de DECODE_PROCESSES).
+        pids = [self.pid]
+        for pid in pids:
+            try:
+                with open(f"/proc/{pid}/task/{pid}/children") as children:
+                    pids.extend(int(child) for child in children.read().split())
+            except OSError:
+                pass
+        return pids
+
+    def _cpu_seconds(self):
+        ticks = os.sysconf("SC_CLK_TCK")
+        total = 0.0
+        for pid in self._pids():
+            try:
+                with open(f"/proc/{pid}/stat") as stat:
+                    fields = stat.read().rsplit(")", 1)[1].split()
+                total += (int(fields[11]) + int(fields[12])) / ticks
+            except OSError:
+                pass
+        return total
+
+    def _rss_bytes(self):
+        total = 0
+        for pid in self._pids():
+            try:
+                with open(f"/proc/{pid}/statm") as statm:
+                    total += int(statm.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+            except OSError:
+                pass
+        return total
+
+    async def _run(self):
+        while True:
+            self.rss_samples.append(self._rss_bytes())
+            await asyncio.sleep(self.interval)
+
+    def start(self):
+        self._cpu_start = (time.perf_counter(), self._cpu_seconds())
+        self._task = asyncio.ensure_future(self._run())
+
+    async def stop(self):
+        self._task.cancel()
+        await asyncio.gather(self._task, return_exceptions=True)
+        self._cpu_end = (time.perf_counter(), self._cpu_seconds())
+
+    def summary(self):
+        wall = self._cpu_end[0] - self._cpu_start[0]
+        cpu = self._cpu_end[1] - self._cpu_start[1]
+        return {
+            "pid": self.pid,
+            "cpu_seconds": cpu,
+            # 1.0 equivale a un núcleo ocupado durante toda la prueba.
+            "cpu_cores": cpu / wall if wall else 0.0,
+            "rss_max_bytes": max(self.rss_samples, default=0),
+            "rss_mean_bytes": statistics.fmean(self.rss_samples) if self.rss_samples else 0,
+        }
+
+# ----------------------------------------------------------------------
+## Clientes
+# ----------------------------------------------------------------------
+
+async def run_stream(uri, sample, chunk_ms, speed):
+    """Reproduce un audio por WebSocket y mide las latencias de ese stream."""
+    pcm, sample_rate, channels = sample
+    chunk_size = int(sample_rate * chunk_ms / 1000) * channels * BYTES_PER_SAMPLE
+    result = {"audio_seconds": audio_seconds(sample), "first_partial": None, "final_after_eof": None, "error": None}
+
+    started = time.perf_counter()
+    try:
+        async with websockets.connect(uri, max_size=None) as websocket:
+            await websocket.send(json.dumps({"type": "start", "sample_rate": sample_rate, "channels": channels}))
+
+            async def receive():
+                # Mide el primer parcial con texto y el último mensaje 'final' (el de FinalResult).
+                async for message in websocket:
+                    response = json.loads(message)
+                    if response.get("type") == "error":
+                        raise RuntimeError(response.get("message"))
+                    if response.get("type") == "partial" and response.get("text") and result["first_partial"] is None:
+                        result["first_partial"] = time.perf_counter() - started
+                    if response.get("type") == "final" and eof_sent is not None:
+                        result["final_after_eof"] = time.perf_counter() - eof_sent
+
+            eof_sent = None
+            receiver = asyncio.ensure_future(receive())
+            # Enviamos los bloques al ritmo indicado: speed=1 es tiempo real, 0 es lo más rápido posible.
+            for i, offset in enumerate(range(0, len(pcm), chunk_size)):
+                await websocket.send(pcm[offset:offset + chunk_size])
+                if speed > 0:
+                    delay = started + (i + 1) * chunk_ms / 1000 / speed - time.perf_counter()
+                    if delay > 0:
+                        await asyncio.sleep(delay)
+            eof_sent = time.perf_counter()
+            await websocket.send(json.dumps({"type": "eof"}))
+            await receiver
+    except Exception as e:
+        result["error"] = f"{type(e).__name__}: {e}"
+    result["wall_seconds"] = time.perf_counter() - started
+    return result
+
+
+async def run_upload(client, url, path, seconds):
+    """Sube un archivo a /transcribe y mide la latencia de la respuesta."""
+    started = time.perf_counter()
+    result = {"audio_seconds": seconds, "latency": None, "error": None}
+    try:
+        with open(path, "rb") as upload:
+            response = await client.post(url, files={"file": (os.path.basename(path), upload)})
+        response.raise_for_status()
+        if "error" in response.json():
+            result["error"] = response.json()["error"]
+        else:
+            result["latency"] = time.perf_counter() - started
+    except Exception as e:
+        result["error"] = f"{type(e).__name__}: {e}"
+    return result
+
+# ----------------------------------------------------------------------
+## Ejecución
+# ----------------------------------------------------------------------
+
+def git_commit():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+async def run_benchmark(args):
+    paths = sorted(glob.glob(os.path.join(args.samples, "*.pcm")) + glob.glob(os.path.join(args.samples, "*.wav")))
+    samples = {path: load_sample(path) for path in paths}
+    # Por WebSocket solo se puede enviar PCM; a /transcribe se sube cualquier formato (preferimos los que no son .pcm).
+    stream_paths = [path for path in paths if samples[path] is not None]
+    upload_paths = [path for path in paths if not path.endswith(".pcm")] or paths
+    if not stream_paths or not upload_paths:
+        raise SystemExit(f"No se encontraron audios en {args.samples}")
+
+    def upload_seconds(path):
+        # La duración de un archivo comprimido se toma del .pcm con el mismo nombre, si existe.
+        sample = samples.get(path) or samples.get(os.path.splitext(path)[0] + ".pcm")
+        return audio_seconds(sample) if sample else None
+
+    sampler = ProcessSampler(args.server_pid) if args.server_pid else None
+    if sampler:
+        sampler.start()
+
+    started = time.perf_counter()
+    ws_uri = args.url.replace("http", "ws", 1) + "/ws/transcribe"
+    streams = [
+        run_stream(ws_uri, samples[stream_paths[i % len(stream_paths)]], args.chunk_ms, args.speed)
+        for i in range(args.streams)
+    ]
+    async with httpx.AsyncClient(timeout=None) as client:
+        uploads = [
+            run_upload(client, f"{args.url}/transcribe", path, upload_seconds(path))
+            for path in (upload_paths[i % len(upload_paths)] for i in range(args.uploads))
+        ]
+        results = await asyncio.gather(asyncio.gather(*streams), asyncio.gather(*uploads))
+    stream_results, upload_results = results
+    wall = time.perf_counter() - started
+
+    if sampler:
+        await sampler.stop()
+
+    ok_streams = [r for r in stream_results if r["error"] is None]
+    ok_uploads = [r for r in upload_results if r["error"] is None]
+    total_audio = sum(r["audio_seconds"] or 0 for r in ok_streams + ok_uploads)
+    return {
+        "commit": git_commit(),
+        "timestamp": time.time(),
+        "config": vars(args),
+        "wall_seconds": wall,
+        "audio_seconds": total_audio,
+        # Tiempo de la prueba / audio procesado: por debajo de 1, el servidor va más rápido que el tiempo real.
+        "aggregate_rtf": wall / total_audio if total_audio else None,
+        "streams": {
+            "total": len(stream_results),
+            "errors": len(stream_results) - len(ok_streams),
+            "first_partial": percentiles([r["first_partial"] for r in ok_streams if r["first_partial"] is not None]),
+            "final_after_eof": percentiles([r["final_after_eof"] for r in ok_streams if r["final_after_eof"] is not None]),
+        },
+        "uploads": {
+            "total": len(upload_results),
+            "errors": len(upload_results) - len(ok_uploads),
+            "latency": percentiles([r["latency"] for r in ok_uploads]),
+            "rtf": percentiles([r["latency"] / r["audio_seconds"] for r in ok_uploads if r["audio_seconds"]]),
+        },
+        "server": sampler.summary() if sampler else None,
+        "error_samples": [r["error"] for r in stream_results + upload_results if r["error"]][:10],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark de carga del servidor de transcripción.")
+    parser.add_argument("--url", default="http://localhost:8000", help="URL base del servidor")
+    parser.add_argument("--samples", default="samples", help="carpeta con los audios .pcm/.wav")
+    parser.add_argument("--streams", type=int, default=10, help="WebSockets simultáneos")
+    parser.add_argument("--uploads", type=int, default=0, help="subidas simultáneas a /transcribe")
+    parser.add_argument("--speed", type=float, default=1.0, help="ritmo de envío: 1 = tiempo real, 0 = sin esperas")
+    parser.add_argument("--chunk-ms", type=int, default=100, help="duración de cada bloque enviado")
+    parser.add_argument("--server-pid", type=int, help="PID del servidor para medir CPU y RSS (Linux)")
+    parser.add_argument("--output", help="archivo JSON donde guardar los resultados")
+    args = parser.parse_args()
+
+    report = asyncio.run(run_benchmark(args))
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as output:
+            output.write(text + "\n")
+    print(text)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,35 @@
+import asyncio
+from app.admission import AdmissionController, AudioBuffer
+
+# Pruebas del control de admisión y de la cola con backpressure de cada stream.
+
+def test_stream_and_file_limits():
+    controller = AdmissionController(max_streams=1, max_file_jobs=1)
+    assert controller.admit_stream()
+    assert not controller.admit_stream()
+    controller.release_stream()
+    assert controller.admit_stream()
+    # Si la decodificación va retrasada, también se rechaza aunque haya hueco.
+    assert controller.admit_file_job(overloaded=False)
+    controller.release_file_job()
+    assert not controller.admit_file_job(overloaded=True)
+    stats = controller.stats()
+    assert (stats["rejected_streams"], stats["rejected_file_jobs"]) == (1, 1)
+
+def test_audio_buffer_blocks_the_reader_when_full():
+    """
+    Cuando la cola llega al límite de bytes, el lector espera hasta que se consuma.
+    """
+    async def scenario():
+        controller = AdmissionController()
+        buffer = AudioBuffer(max_bytes=100, controller=controller)
+        await buffer.put("a", 60)
+        blocked = asyncio.ensure_future(buffer.put("b", 60))
+        await asyncio.sleep(0.01)
+        assert not blocked.done()
+        assert await buffer.get() == "a"
+        await asyncio.wait_for(blocked, 1)
+        assert await buffer.get() == "b"
+        return controller.backpressure_pauses
+
+    assert asyncio.run(scenario()) == 1
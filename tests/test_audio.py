@@ -0,0 +1,157 @@
+import asyncio
+import io
+import os
+import tempfile
+import wave
+import numpy as np
+import pytest
+from app import audio
+
+# Pruebas de la detección de silencios usada por el modo paralelo de /transcribe.
+
+def _tone(seconds, rate=16000):
+    t = np.arange(int(seconds * rate)) / rate
+    return (8000 * np.sin(2 * np.pi * 440 * t)).astype("<i2")
+
+def _silence(seconds, rate=16000):
+    return np.zeros(int(seconds * rate), dtype="<i2")
+
+def test_find_silence_cuts_splits_in_the_pauses():
+    """
+    Los cortes caen dentro de los silencios y respetan la duración mínima de los segmentos.
+    """
+    pcm = np.concatenate([
+        _tone(3), _silence(1), _tone(3), _silence(0.1), _tone(3), _silence(1), _tone(3),
+    ]).tobytes()
+
+    cuts = audio.find_silence_cuts(pcm, min_silence_ms=300, min_segment_seconds=2)
+    seconds = [cut / 16000 for cut in cuts]
+
+    # La pausa corta (0.1 s) no se usa como punto de corte.
+    assert len(seconds) == 2
+    assert 3 <= seconds[0] <= 4
+    assert 10.1 <= seconds[1] <= 11.1
+
+def test_segment_bounds_cover_the_whole_audio():
+    assert audio.segment_bounds(100, [30, 70]) == [(0, 30), (30, 70), (70, 100)]
+    assert audio.segment_bounds(100, []) == [(0, 100)]
+
+# ----------------------------------------------------------------------
+## Camino rápido para WAV ya conformes (sin FFmpeg)
+# ----------------------------------------------------------------------
+
+def _wav(pcm, rate=16000, channels=1):
+    data = io.BytesIO()
+    with wave.open(data, "wb") as wav:
+        wav.setnchannels(channels)
+        wav.setsampwidth(2)
+        wav.setframerate(rate)
+        wav.writeframes(pcm)
+    data.seek(0)
+    return data
+
+def _collect(source, chunk_size):
+    async def collect():
+        return [chunk async for chunk in audio.upload_pcm_chunks(source, chunk_size)]
+    return asyncio.run(collect())
+
+def test_sniff_pcm_wav_accepts_only_the_vosk_format():
+    pcm = _tone(0.5).tobytes()
+    offset, size = audio.sniff_pcm_wav(_wav(pcm))
+    assert (offset, size) == (44, len(pcm))
+    assert audio.sniff_pcm_wav(_wav(pcm, rate=8000)) is None
+    assert audio.sniff_pcm_wav(_wav(pcm, channels=2)) is None
+    with open("samples/1.wav", "rb") as other_container:
+        assert audio.sniff_pcm_wav(other_container) is None
+
+def test_conforming_wav_is_read_without_ffmpeg(tmp_path):
+    """
+    El PCM de un WAV conforme sale tal cual, tanto en memoria como desde un archivo en disco (mmap).
+    """
+    pcm = _tone(0.5).tobytes()
+    chunks = _collect(_wav(pcm), 3000)
+    assert b"".join(chunks) == pcm
+    assert [len(chunk) for chunk in chunks[:-1]] == [3000] * (len(chunks) - 1)
+
+    path = tmp_path / "clip.wav"
+    path.write_bytes(_wav(pcm).getvalue())
+    with open(path, "rb") as on_disk:
+        assert b"".join(_collect(on_disk, 3000)) == pcm
+
+    # SpooledTemporaryFile (como los archivos de UploadFile) antes y después de pasar a disco.
+    for max_size in (10 ** 6, 10):
+        spooled = tempfile.SpooledTemporaryFile(max_size=max_size)
+        spooled.write(_wav(pcm).getvalue())
+        spooled.seek(0)
+        assert b"".join(_collect(spooled, 3000)) == pcm
+
+# ----------------------------------------------------------------------
+## Conversión con FFmpeg por pipe (con un FFmpeg falso en el PATH)
+# ----------------------------------------------------------------------
+
+# Copia la entrada (stdin o el archivo de '-i') a la salida sin convertir nada.
+# FAKE_FFMPEG_FAIL=1 hace que falle siempre; FAKE_FFMPEG_PIPE_FAIL=1, solo cuando lee de un pipe
+# (como FFmpeg con un MP4 que tiene el índice 'moov' al final).
+FAKE_FFMPEG = """#!/bin/sh
+echo $$ >> "$FAKE_FFMPEG_PIDS"
+while [ $# -gt 0 ]; do [ "$1" = "-i" ] && input="$2"; shift; done
+if [ -n "$FAKE_FFMPEG_FAIL" ]; then cat > /dev/null; echo "Invalid data found" >&2; exit 1; fi
+if [ "$input" = "pipe:0" ]; then
+    if [ -n "$FAKE_FFMPEG_PIPE_FAIL" ]; then cat > /dev/null; echo "moov atom not found" >&2; exit 1; fi
+    exec cat
+fi
+exec cat "$input"
+"""
+
+@pytest.fixture
+def fake_ffmpeg(tmp_path, monkeypatch):
+    ffmpeg = tmp_path / "ffmpeg"
+    ffmpeg.write_text(FAKE_FFMPEG)
+    ffmpeg.chmod(0o755)
+    pids = tmp_path / "pids"
+    pids.write_text("")
+    monkeypatch.setenv("PATH", f"{tmp_path}{os.pathsep}{os.environ['PATH']}")
+    monkeypatch.setenv("FAKE_FFMPEG_PIDS", str(pids))
+    # Devuelve los PID de las ejecuciones de FFmpeg.
+    return lambda: [int(pid) for pid in pids.read_text().split()]
+
+def _convert(source, chunk_size):
+    async def collect():
+        return [chunk async for chunk in audio.ffmpeg_pcm_chunks(source, chunk_size)]
+    return asyncio.run(collect())
+
+def test_ffmpeg_output_is_split_in_fixed_blocks(fake_ffmpeg):
+    data = os.urandom(20000)
+    chunks = _convert(io.BytesIO(data), 8000)
+    # Bloques de tamaño fijo y el último, más corto.
+    assert [len(chunk) for chunk in chunks] == [8000, 8000, 4000]
+    assert b"".join(chunks) == data
+
+def test_ffmpeg_failure_raises_conversion_error(fake_ffmpeg, monkeypatch):
+    monkeypatch.setenv("FAKE_FFMPEG_FAIL", "1")
+    with pytest.raises(audio.ConversionError) as error:
+        _convert(io.BytesIO(b"no es audio"), 8000)
+    assert "Invalid data found" in error.value.details
+
+def test_unstreamable_containers_are_retried_with_a_seekable_input(fake_ffmpeg, monkeypatch, tmp_path):
+    monkeypatch.setenv("FAKE_FFMPEG_PIPE_FAIL", "1")
+    data = os.urandom(10000)
+    # En memoria (se copia a un temporal) y en disco (FFmpeg abre el mismo archivo).
+    assert b"".join(_convert(io.BytesIO(data), 8000)) == data
+    path = tmp_path / "llamada.m4a"
+    path.write_bytes(data)
+    with open(path, "rb") as on_disk:
+        assert b"".join(_convert(on_disk, 8000)) == data
+    assert len(fake_ffmpeg()) == 4
+
+def test_ffmpeg_is_killed_when_the_consumer_stops_early(fake_ffmpeg):
+    async def first_chunk():
+        chunks = audio.ffmpeg_pcm_chunks(io.BytesIO(os.urandom(4 * 1024 * 1024)), 8000)
+        chunk = await chunks.__anext__()
+        await chunks.aclose()
+        return chunk
+
+    assert len(asyncio.run(first_chunk())) == 8000
+    # El proceso ya terminó (y se recogió su estado): no queda ningún FFmpeg colgado.
+    with pytest.raises(ProcessLookupError):
+        os.kill(fake_ffmpeg()[0], 0)
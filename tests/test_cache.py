@@ -0,0 +1,38 @@
+import io
+import json
+from app.cache import TranscriptionCache, cache_key
+
+# Pruebas de la caché de resultados de /transcribe.
+
+def test_cache_key_depends_on_content_model_and_options():
+    upload = io.BytesIO(b"audio" * 1000)
+    key = cache_key(upload, "modelo-a", {"parallel": False})
+    # El archivo queda listo para volver a leerse.
+    assert upload.tell() == 0
+    assert cache_key(upload, "modelo-a", {"parallel": False}) == key
+    assert cache_key(upload, "modelo-b", {"parallel": False}) != key
+    assert cache_key(upload, "modelo-a", {"parallel": True}) != key
+    assert cache_key(io.BytesIO(b"otro audio"), "modelo-a", {"parallel": False}) != key
+
+def test_memory_tier_evicts_least_recently_used():
+    entry = {"text": "x" * 50}
+    size = len(json.dumps(entry).encode())
+    cache = TranscriptionCache(max_bytes=2 * size, directory=None)
+    cache.put("a", entry)
+    cache.put("b", entry)
+    assert cache.get("a") == entry  # 'a' pasa a ser la más reciente
+    cache.put("c", entry)           # expulsa 'b'
+    assert cache.get("b") is None
+    assert cache.get("c") == entry
+    stats = cache.stats()
+    assert (stats["hits"], stats["misses"], stats["evictions"]) == (2, 1, 1)
+    assert stats["bytes"] <= stats["max_bytes"]
+
+def test_disk_tier_survives_restarts(tmp_path):
+    TranscriptionCache(directory=str(tmp_path)).put("clave", {"text": "café con pan"})
+    restarted = TranscriptionCache(directory=str(tmp_path))
+    assert restarted.get("clave") == {"text": "café con pan"}
+    assert restarted.stats()["disk_hits"] == 1
+    # La segunda lectura ya viene de la memoria.
+    restarted.get("clave")
+    assert restarted.stats()["disk_hits"] == 1
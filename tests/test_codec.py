@@ -0,0 +1,47 @@
+import numpy as np
+import pytest
+from app import codec
+
+# Pruebas de la decodificación de audio comprimido del WebSocket.
+
+def mulaw_encode(samples):
+    # Codificador µ-law de referencia (G.711), solo para generar datos de prueba.
+    samples = np.clip(samples.astype(np.int32), -32635, 32635)
+    sign = np.where(samples < 0, 0x80, 0)
+    magnitude = np.abs(samples) + 0x84
+    exponent = np.floor(np.log2(magnitude)).astype(np.int32) - 7
+    mantissa = (magnitude >> (exponent + 3)) & 0x0F
+    return (~(sign | (exponent << 4) | mantissa) & 0xFF).astype(np.uint8)
+
+def test_g711_tables_known_values():
+    assert codec.G711_TABLES["mulaw"][0xFF] == 0
+    assert codec.G711_TABLES["mulaw"][0x00] == -32124
+    assert codec.G711_TABLES["alaw"][0xD5] == 8
+    assert codec.G711_TABLES["alaw"][0xAA] == 32256
+
+def test_mulaw_roundtrip_is_close():
+    """
+    Codificar y decodificar µ-law conserva la señal con el error propio de G.711 (< 3 %).
+    """
+    t = np.arange(8000) / 8000
+    original = (10000 * np.sin(2 * np.pi * 440 * t)).astype(np.int16)
+    decoder = codec.codec_from_handshake("mulaw", 8000, 1)
+    encoded = mulaw_encode(original).tobytes()
+    # Se decodifica por bloques de tamaño arbitrario; cada byte es una muestra independiente.
+    decoded = b"".join(decoder.decode(encoded[i:i + 333]) for i in range(0, len(encoded), 333))
+    result = np.frombuffer(decoded, dtype="<i2").astype(np.int32)
+    assert len(result) == len(original)
+    assert np.max(np.abs(result - original)) <= 0.03 * 10000
+
+def test_invalid_codecs_are_rejected():
+    with pytest.raises(ValueError):
+        codec.codec_from_handshake("mp3", 16000, 1)
+    assert codec.codec_from_handshake(None, 16000, 1).name == "pcm_s16le"
+
+@pytest.mark.skipif(codec.opuslib is None, reason="opuslib/libopus no disponible")
+def test_opus_decodes_to_16k_mono():
+    encoder = codec.opuslib.Encoder(48000, 2, codec.opuslib.APPLICATION_VOIP)
+    packet = encoder.encode(b"\x00" * 960 * 4, 960)
+    decoder = codec.codec_from_handshake("opus", 48000, 2)
+    # 20 ms a 16 kHz mono = 320 muestras.
+    assert len(decoder.decode(packet)) == 320 * 2
@@ -0,0 +1,57 @@
+import asyncio
+import threading
+import time
+from app.decoder import DecodeExecutor
+
+# Pruebas del ejecutor de decodificación. No necesitan el modelo de Vosk:
+# usamos funciones simples en lugar de llamadas a Kaldi.
+
+def test_lane_keeps_calls_in_order():
+    """
+    Las llamadas de un mismo carril se ejecutan en el orden en que se enviaron.
+    """
+    async def scenario():
+        executor = DecodeExecutor(workers=4, max_pending=8)
+        lane = executor.lane()
+        order = []
+
+        def work(i):
+            # Las primeras tareas tardan más: si no hubiera orden, terminarían al final.
+            time.sleep(0.01 * (5 - i))
+            order.append(i)
+
+        await asyncio.gather(*(lane.run(work, i) for i in range(5)))
+        executor.shutdown()
+        return order
+
+    assert asyncio.run(scenario()) == [0, 1, 2, 3, 4]
+
+def test_queue_depth_is_bounded():
+    """
+    Nunca hay más tareas ejecutándose o en cola que 'max_pending'.
+    """
+    async def scenario():
+        executor = DecodeExecutor(workers=4, max_pending=2)
+        running = []
+        peak = [0]
+        lock = threading.Lock()
+
+        def work():
+            with lock:
+                running.append(1)
+                peak[0] = max(peak[0], len(running))
+            time.sleep(0.02)
+            with lock:
+                running.pop()
+
+        # Cada tarea usa su propio carril para que puedan ejecutarse en paralelo.
+        await asyncio.gather(*(executor.lane().run(work) for _ in range(8)))
+        stats = executor.stats()
+        executor.shutdown()
+        return peak[0], stats
+
+    peak, stats = asyncio.run(scenario())
+    assert peak <= 2
+    assert stats["completed"] == 8
+    assert stats["pending"] == 0
+    assert stats["queue_wait_max"] > 0
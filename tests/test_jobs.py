@@ -0,0 +1,61 @@
+import asyncio
+from app import jobs
+
+# Pruebas del planificador de trabajos. Sustituimos la transcripción por una función
+# que solo registra el orden de ejecución.
+
+def _scheduler(monkeypatch, order, delay=0.0):
+    async def fake_transcribe(source, parallel=False):
+        order.append(source.name)
+        await asyncio.sleep(delay)
+        return {"text": source.name}
+    monkeypatch.setattr(jobs.transcription, "transcribe", fake_transcribe)
+    return jobs.JobScheduler(max_concurrent=1)
+
+def _job(tmp_path, name, client, priority=jobs.DEFAULT_PRIORITY):
+    path = tmp_path / name
+    path.write_bytes(b"audio")
+    return jobs.Job(str(path), name, client, priority, False)
+
+def test_priority_then_round_robin_between_clients(monkeypatch, tmp_path):
+    """
+    Primero la prioridad más alta; dentro de la misma prioridad, los clientes se turnan.
+    """
+    async def scenario():
+        order = []
+        scheduler = _scheduler(monkeypatch, order)
+        submitted = [
+            _job(tmp_path, "a1", "a"), _job(tmp_path, "a2", "a"), _job(tmp_path, "a3", "a"),
+            _job(tmp_path, "b1", "b"), _job(tmp_path, "urgente", "b", priority=9),
+        ]
+        for job in submitted:
+            await scheduler.submit(job)
+        scheduler.start()
+        while any(job.status != "done" for job in submitted):
+            await asyncio.sleep(0.01)
+        await scheduler.stop()
+        return [name.rsplit("/", 1)[-1] for name in order], submitted
+
+    order, submitted = asyncio.run(scenario())
+    assert order == ["urgente", "a1", "b1", "a2", "a3"]
+    assert submitted[0].result == {"text": str(tmp_path / "a1")}
+    # Los archivos de los trabajos terminados se borran.
+    assert not any((tmp_path / name).exists() for name in ["a1", "a2", "a3", "b1", "urgente"])
+
+def test_cancel_queued_and_running_jobs(monkeypatch, tmp_path):
+    async def scenario():
+        scheduler = _scheduler(monkeypatch, [], delay=10)
+        running = await scheduler.submit(_job(tmp_path, "largo", "a"))
+        queued = await scheduler.submit(_job(tmp_path, "en-cola", "a"))
+        scheduler.start()
+        while running.status != "running":
+            await asyncio.sleep(0.01)
+        await scheduler.cancel(queued)
+        await scheduler.cancel(running)
+        await scheduler.stop()
+        return running, queued
+
+    running, queued = asyncio.run(scenario())
+    assert running.status == "cancelled"
+    assert queued.status == "cancelled"
+    assert queued.started_at is None
@@ -0,0 +1,54 @@
+import asyncio
+from app import main, metrics
+from app.metrics import Counter, Gauge, Histogram
+
+# Pruebas del formato de texto de Prometheus generado por 'app.metrics'.
+
+def _render(metric):
+    # Cada métrica se registra globalmente; aquí solo nos interesa su salida.
+    return "\n".join(metric.render())
+
+def test_counter_with_labels():
+    counter = Counter("test_bytes_total", "Bytes", labelnames=("protocol", "direction"))
+    counter.labels("ws", "in").inc(10)
+    counter.labels("ws", "in").inc(5)
+    text = _render(counter)
+    assert "# TYPE test_bytes_total counter" in text
+    assert 'test_bytes_total{protocol="ws",direction="in"} 15.0' in text
+
+def test_histogram_buckets_are_cumulative():
+    histogram = Histogram("test_seconds", "Latency", buckets=(0.1, 1))
+    for value in (0.05, 0.5, 2):
+        histogram.observe(value)
+    text = _render(histogram)
+    assert 'test_seconds_bucket{le="0.1"} 1' in text
+    assert 'test_seconds_bucket{le="1"} 2' in text
+    assert 'test_seconds_bucket{le="+Inf"} 3' in text
+    assert "test_seconds_count 3" in text
+
+def test_gauge_is_skipped_when_not_available():
+    assert _render(Gauge("test_ready", "Ready", lambda: 1)).endswith("test_ready 1.0")
+    assert _render(Gauge("test_missing", "Missing", lambda: None.value)) == ""
+
+def test_http_response_bodies_are_counted_as_bytes_out(monkeypatch):
+    counter = Counter("test_http_bytes_total", "Bytes", labelnames=("protocol", "direction"))
+    monkeypatch.setattr(metrics, "BYTES", counter)
+
+    async def app(scope, receive, send):
+        # Respuesta incremental: cabeceras y dos trozos del cuerpo.
+        await send({"type": "http.response.start", "status": 200, "headers": []})
+        await send({"type": "http.response.body", "body": b'{"type": "partial"}\n', "more_body": True})
+        await send({"type": "http.response.body", "body": b'{"type": "final"}\n'})
+
+    async def receive():
+        return {"type": "http.request", "body": b""}
+
+    async def send(message):
+        pass
+
+    middleware = main._CountResponseBytes(app)
+    asyncio.run(middleware({"type": "http", "path": "/transcribe"}, receive, send))
+    assert counter.labels("http", "out").value == 38
+    # Las respuestas de /metrics no son tráfico de transcripción.
+    asyncio.run(middleware({"type": "http", "path": "/metrics"}, receive, send))
+    assert counter.labels("http", "out").value == 38
@@ -0,0 +1,91 @@
+import asyncio
+import pytest
+from app.models import ModelRegistry, ModelNotFound, ModelLoadError, discover_models
+
+# Pruebas del registro de modelos. No cargamos modelos reales de Vosk: el "cargador"
+# es una función falsa y el tamaño de cada modelo es el de los archivos de su carpeta.
+
+def make_models(tmp_path, sizes):
+    paths = {}
+    for name, size in sizes.items():
+        folder = tmp_path / "models" / name
+        folder.mkdir(parents=True)
+        (folder / "final.mdl").write_bytes(b"\x00" * size)
+        paths[name] = str(folder)
+    return paths
+
+def test_discover_models(tmp_path):
+    make_models(tmp_path, {"es": 1, "en": 1})
+    (tmp_path / "model").mkdir()
+    found = discover_models(str(tmp_path / "models"), str(tmp_path / "model"))
+    assert sorted(found) == ["default", "en", "es"]
+
+def test_models_load_lazily_once(tmp_path):
+    loaded = []
+
+    def loader(path):
+        loaded.append(path)
+        return f"modelo {path}"
+
+    async def scenario():
+        registry = ModelRegistry(make_models(tmp_path, {"es": 10}), default="es", loader=loader)
+        assert not registry.ready and loaded == []
+        # Dos sesiones a la vez esperan a la misma carga.
+        first, second = await asyncio.gather(registry.acquire(), registry.acquire("es"))
+        assert first is second and first.refs == 2
+        assert registry.ready and len(loaded) == 1
+        with pytest.raises(ModelNotFound):
+            registry.get("fr")
+
+    asyncio.run(scenario())
+
+def test_lru_eviction_skips_models_in_use(tmp_path):
+    evicted = []
+
+    async def scenario():
+        registry = ModelRegistry(
+            make_models(tmp_path, {"a": 10, "b": 10, "c": 10}), default="a", max_bytes=20,
+            loader=lambda path: path, on_evict=evicted.append,
+        )
+        a = await registry.acquire("a")
+        b = await registry.acquire("b")
+        registry.release(b)
+        # 'a' está en uso: para cargar 'c' se descarga 'b'.
+        await registry.acquire("c")
+        assert evicted == ["b"]
+        assert (a.state, b.state) == ("loaded", "available")
+        assert registry.resident_bytes == 20
+
+    asyncio.run(scenario())
+
+def test_default_model_is_never_evicted(tmp_path):
+    async def scenario():
+        registry = ModelRegistry(
+            make_models(tmp_path, {"default": 10, "en": 10}), max_bytes=15, loader=lambda path: path,
+        )
+        registry.release(await registry.acquire())
+        assert registry.ready
+        # Aunque no quepan los dos, cargar otro modelo no deja al nodo sin modelo por defecto.
+        registry.release(await registry.acquire("en"))
+        assert registry.ready and registry.get().state == "loaded"
+
+    asyncio.run(scenario())
+
+def test_failed_load_can_be_retried(tmp_path):
+    attempts = []
+
+    def loader(path):
+        attempts.append(path)
+        if len(attempts) == 1:
+            raise RuntimeError("disco lleno")
+        return "modelo"
+
+    async def scenario():
+        registry = ModelRegistry(make_models(tmp_path, {"es": 1}), default="es", loader=loader)
+        with pytest.raises(ModelLoadError):
+            await registry.acquire()
+        entry = registry.get()
+        assert entry.state == "failed" and entry.refs == 0
+        assert (await registry.acquire()).model == "modelo"
+
+    asyncio.run(scenario())
@@ -0,0 +1,38 @@
+import numpy as np
+import pytest
+from app.resample import StreamResampler
+
+# Pruebas del remuestreador polifásico usado en /ws/transcribe.
+
+def _sine(rate, seconds, freq=440, amplitude=8000):
+    t = np.arange(int(rate * seconds)) / rate
+    return (amplitude * np.sin(2 * np.pi * freq * t)).astype("<i2")
+
+@pytest.mark.parametrize("rate", [8000, 22050, 44100, 48000])
+def test_resampled_tone_keeps_frequency_and_level(rate):
+    """
+    Un tono de 440 Hz sigue siendo de 440 Hz y con el mismo nivel a 16 kHz.
+    """
+    resampler = StreamResampler(rate, 16000)
+    out = np.frombuffer(resampler.process(_sine(rate, 1).tobytes()), dtype="<i2").astype(np.float64)
+    assert abs(len(out) - 16000) <= 1
+    # Ignoramos el arranque del filtro.
+    steady = out[200:]
+    spectrum = np.abs(np.fft.rfft(steady))
+    peak = np.argmax(spectrum) * 16000 / len(steady)
+    assert abs(peak - 440) < 5
+    assert abs(np.sqrt(np.mean(steady ** 2)) - 8000 / np.sqrt(2)) < 200
+
+def test_chunked_processing_matches_single_call():
+    """
+    El estado del filtro se conserva entre bloques: el resultado no depende de cómo se corte el audio.
+    """
+    stereo = np.stack([_sine(44100, 0.5), _sine(44100, 0.5, freq=1000)], axis=1).tobytes()
+    whole = StreamResampler(44100, 16000, channels=2).process(stereo)
+
+    resampler = StreamResampler(44100, 16000, channels=2)
+    # Bloques de tamaño irregular, incluso partiendo muestras y frames estéreo.
+    pieces = [stereo[i:i + 1001] for i in range(0, len(stereo), 1001)]
+    chunked = b"".join(resampler.process(piece) for piece in pieces)
+    assert chunked == whole
+    assert resampler.cpu_seconds > 0
@@ -0,0 +1,112 @@
+import asyncio
+from app import workers
+from app.services import RecognizerPool
+
+# Pruebas del pool de reconocedores (sin modelo de Vosk: usamos un reconocedor falso).
+
+class FakeModel:
+    def __init__(self, name):
+        self.name = name
+        self.model = object()
+
+MODEL = FakeModel("default")
+
+class InlineLane:
+    """Carril que ejecuta las llamadas en el momento y las apunta."""
+
+    def __init__(self):
+        self.calls = []
+
+    async def run(self, fn, *args):
+        self.calls.append(getattr(fn, "__name__", fn))
+        return fn(*args)
+
+LANE = InlineLane()
+
+def acquire(pool, model, sample_rate, words=False):
+    return asyncio.run(pool.acquire(model, sample_rate, LANE, words=words))
+
+class FakeRecognizer:
+    def __init__(self, sample_rate, model):
+        self.sample_rate = sample_rate
+        self.model = model
+        self.words = False
+        self.resets = 0
+
+    def SetWords(self, enable):
+        self.words = enable
+
+    def Reset(self):
+        self.resets += 1
+
+def test_recognizers_are_reused_and_reset():
+    pool = RecognizerPool(factory=FakeRecognizer)
+    first = acquire(pool, MODEL, 16000)
+    pool.release(first)
+    second = acquire(pool, MODEL, 16000)
+    assert second is first
+    assert second.resets == 1
+    assert (pool.stats()["hits"], pool.stats()["misses"]) == (1, 1)
+
+def test_setup_calls_run_on_the_session_lane():
+    # Creación, SetWords y Reset pasan por el carril (con DECODE_PROCESSES son llamadas por un pipe).
+    pool = RecognizerPool(factory=FakeRecognizer)
+    lane = InlineLane()
+    recognizer = asyncio.run(pool.acquire(MODEL, 16000, lane, words=True))
+    pool.release(recognizer)
+    asyncio.run(pool.acquire(MODEL, 16000, lane, words=True))
+    assert lane.calls == ["_create", "Reset"]
+    # El precalentamiento también crea los reconocedores en el carril.
+    lane.calls.clear()
+    asyncio.run(pool.prewarm(MODEL, 2, 16000, lane))
+    assert lane.calls == ["_create", "_create"] and pool.idle == 2
+
+def test_pool_is_keyed_by_model_sample_rate_and_options():
+    pool = RecognizerPool(factory=FakeRecognizer)
+    asyncio.run(pool.prewarm(MODEL, 1, 16000, LANE))
+    words = acquire(pool, MODEL, 16000, words=True)
+    assert words.words and pool.idle == 1
+    narrowband = acquire(pool, MODEL, 8000)
+    assert narrowband.sample_rate == 8000 and pool.idle == 1
+    other = acquire(pool, FakeModel("en"), 16000)
+    assert other.model is not MODEL.model and pool.idle == 1
+    # Al descargar un modelo se sueltan sus reconocedores libres.
+    pool.drop("default")
+    assert pool.idle == 0
+
+def test_unusable_and_idle_recognizers_are_dropped():
+    now = [0.0]
+    pool = RecognizerPool(factory=FakeRecognizer, max_idle=1, idle_seconds=10, clock=lambda: now[0])
+    a, b = acquire(pool, MODEL, 16000), acquire(pool, MODEL, 16000)
+    pool.release(a, reusable=False)
+    pool.release(b)
+    assert pool.idle == 1 and pool.stats()["discarded"] == 1
+    # Pasado el tiempo máximo sin uso, el reconocedor libre se descarta.
+    now[0] += 11
+    pool.trim()
+    assert pool.idle == 0 and pool.stats()["trimmed"] == 1
+
+def test_idle_recognizers_are_trimmed_without_new_sessions():
+    async def scenario():
+        pool = RecognizerPool(factory=FakeRecognizer, idle_seconds=0.01)
+        await pool.prewarm(MODEL, 2, 16000, LANE)
+        pool.start()
+        try:
+            await asyncio.sleep(0.05)
+        finally:
+            await pool.stop()
+        return pool
+
+    pool = asyncio.run(scenario())
+    assert pool.idle == 0 and pool.stats()["trimmed"] == 2
+
+def test_recognizers_of_dead_workers_are_replaced():
+    class DeadRecognizer(FakeRecognizer):
+        def Reset(self):
+            raise workers.WorkerError("Decode worker decode-worker-0 is not available")
+
+    pool = RecognizerPool(factory=FakeRecognizer, clock=lambda: 0.0)
+    pool._idle[("default", 16000, False)].append((DeadRecognizer(16000, MODEL.model), 0.0))
+    recognizer = acquire(pool, MODEL, 16000)
+    assert type(recognizer) is FakeRecognizer
+    assert pool.stats()["discarded"] == 1 and pool.stats()["misses"] == 1
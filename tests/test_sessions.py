@@ -0,0 +1,150 @@
+import asyncio
+import json
+import time
+from fastapi.testclient import TestClient
+from app import main, models, services, sessions
+from app.sessions import ParkedSession, SessionTable
+
+# Pruebas de la tabla de sesiones reanudables (caducidad, límite y recuperación) y del
+# protocolo de reanudación de /ws/transcribe, con un modelo y un reconocedor falsos.
+
+class FakeSession:
+    def __init__(self):
+        self.recognizer = object()
+
+class Releases:
+    """Anota qué reconocedores y modelos se liberan al descartar una sesión."""
+
+    def __init__(self):
+        self.recognizers = []
+        self.models = []
+
+    def release(self, item, *args):
+        (self.models if isinstance(item, str) else self.recognizers).append(item)
+
+def _patch(monkeypatch):
+    releases = Releases()
+    monkeypatch.setattr(services, "RECOGNIZER_POOL", releases)
+    monkeypatch.setattr(models, "MODEL_REGISTRY", releases)
+    return releases
+
+def _parked(table, offset=0):
+    return ParkedSession(table.new_token(), FakeSession(), "modelo", "json", offset, [])
+
+def test_parked_session_can_be_resumed_once(monkeypatch):
+    releases = _patch(monkeypatch)
+
+    async def scenario():
+        table = SessionTable(grace_seconds=10)
+        parked = _parked(table, offset=4000)
+        table.park(parked)
+        assert table.claim(parked.token) is parked
+        assert table.claim(parked.token) is None
+        assert table.claim(None) is None
+        # Una sesión reanudada no se libera: sigue en uso por la nueva conexión.
+        assert releases.recognizers == []
+
+    asyncio.run(scenario())
+
+def test_sessions_expire_after_the_grace_period(monkeypatch):
+    releases = _patch(monkeypatch)
+
+    async def scenario():
+        table = SessionTable(grace_seconds=0.01)
+        parked = _parked(table)
+        table.park(parked)
+        await asyncio.sleep(0.05)
+        assert table.claim(parked.token) is None
+        assert table.stats()["expired"] == 1
+        assert releases.recognizers == [parked.session.recognizer]
+        assert releases.models == ["modelo"]
+
+    asyncio.run(scenario())
+
+def test_oldest_session_is_evicted_when_full(monkeypatch):
+    releases = _patch(monkeypatch)
+
+    async def scenario():
+        table = SessionTable(grace_seconds=10, max_sessions=2)
+        first, second, third = _parked(table), _parked(table), _parked(table)
+        for parked in (first, second, third):
+            table.park(parked)
+        assert len(table) == 2 and table.stats()["evicted"] == 1
+        assert table.claim(first.token) is None
+        assert releases.recognizers == [first.session.recognizer]
+        table.close()
+        assert len(table) == 0 and len(releases.recognizers) == 3
+
+    asyncio.run(scenario())
+
+
+class CountingRecognizer:
+    """Cuenta los bytes de audio recibidos; el resultado final dice cuántos fueron."""
+
+    def __init__(self, sample_rate, model):
+        self.received = 0
+
+    def SetWords(self, enable):
+        pass
+
+    def Reset(self):
+        self.received = 0
+
+    def AcceptWaveform(self, data):
+        self.received += len(data)
+        return False
+
+    def PartialResult(self):
+        return json.dumps({"partial": f"{self.received}"})
+
+    def FinalResult(self):
+        return json.dumps({"text": f"recibidos {self.received}"})
+
+def _wait_until(condition):
+    # El servidor de TestClient atiende la desconexión en otro hilo.
+    deadline = time.monotonic() + 5
+    while not condition():
+        assert time.monotonic() < deadline
+        time.sleep(0.01)
+
+def test_websocket_session_is_parked_and_resumed(monkeypatch, tmp_path):
+    monkeypatch.setattr(models, "discover_models", lambda: {"default": str(tmp_path)})
+    monkeypatch.setattr(services, "load_vosk_model", lambda path: "modelo")
+    monkeypatch.setattr(services, "create_recognizer", CountingRecognizer)
+    pcm = b"\x00\x01" * 16000
+
+    with TestClient(main.app) as client:
+        with client.websocket_connect("/ws/transcribe") as websocket:
+            websocket.send_json({"type": "start", "sample_rate": 16000, "channels": 1, "resumable": True})
+            started = websocket.receive_json()
+            assert started["type"] == "session" and started["offset"] == 0
+            token = started["session_id"]
+            for offset in range(0, 16000, 4000):
+                websocket.send_bytes(pcm[offset:offset + 4000])
+                assert websocket.receive_json()["type"] == "partial"
+        # La conexión se cortó sin 'eof': la sesión queda aparcada con su reconocedor.
+        table = sessions.SESSION_TABLE
+        _wait_until(lambda: len(table) == 1)
+        # Un resultado que no se llegó a enviar antes del corte se entrega al reanudar.
+        table._parked[token].unsent.append({"type": "final", "text": "pendiente"})
+
+        with client.websocket_connect("/ws/transcribe") as websocket:
+            websocket.send_json({"type": "resume", "session_id": token})
+            resumed = websocket.receive_json()
+            assert resumed["type"] == "resumed" and resumed["session_id"] == token
+            offset = resumed["offset"]
+            assert 0 < offset <= 16000
+            assert websocket.receive_json() == {"type": "final", "text": "pendiente"}
+            # El cliente sigue desde 'offset': el reconocedor conserva el audio ya procesado.
+            websocket.send_bytes(pcm[offset:])
+            websocket.send_json({"type": "eof"})
+            final = websocket.receive_json()
+            while final["type"] != "final":
+                final = websocket.receive_json()
+            assert final["text"] == f"recibidos {len(pcm)}"
+
+        # El token solo sirve una vez.
+        with client.websocket_connect("/ws/transcribe") as websocket:
+            websocket.send_json({"type": "resume", "session_id": token})
+            assert websocket.receive_json()["message"] == "Unknown or expired session."
+        assert table.stats()["resumed"] == 1 and len(table) == 0
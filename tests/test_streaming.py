@@ -0,0 +1,65 @@
+import asyncio
+import json
+import pytest
+from app.decoder import DecodeExecutor
+from app.streaming import StreamSession, stream_options_from_handshake
+
+# Pruebas de la lógica de audio de /ws/transcribe con un reconocedor falso.
+
+class FakeRecognizer:
+    """Devuelve el mismo parcial durante 3 bloques y luego cambia."""
+
+    def __init__(self):
+        self.chunks = 0
+        self.partial_calls = 0
+
+    def AcceptWaveform(self, data):
+        self.chunks += 1
+        return False
+
+    def PartialResult(self):
+        self.partial_calls += 1
+        return json.dumps({"partial": f"texto {self.chunks // 3}"})
+
+    def FinalResult(self):
+        return json.dumps({"text": "final"})
+
+
+def _run(**options):
+    async def scenario():
+        executor = DecodeExecutor(workers=1, max_pending=4)
+        recognizer = FakeRecognizer()
+        session = StreamSession(recognizer, executor.lane(), **options)
+        messages = []
+        for _ in range(9):
+            messages.extend(await session.accept_audio(b"\x00" * 320))
+        executor.shutdown()
+        return messages, recognizer
+    return asyncio.run(scenario())
+
+def test_partials_always():
+    messages, _ = _run()
+    assert len(messages) == 9
+
+def test_partials_only_on_change():
+    messages, _ = _run(partials="changed")
+    assert [m["text"] for m in messages] == ["texto 0", "texto 1", "texto 2", "texto 3"]
+
+def test_partials_disabled_skip_the_recognizer():
+    messages, recognizer = _run(partials="none")
+    assert messages == []
+    assert recognizer.partial_calls == 0
+
+def test_partials_minimum_interval():
+    messages, recognizer = _run(partial_interval=60)
+    # Solo el primer parcial cabe en un intervalo de 60 s.
+    assert len(messages) == 1
+    assert recognizer.partial_calls == 1
+
+def test_stream_options_validation():
+    assert stream_options_from_handshake({}) == {"partials": "always", "partial_interval": 0, "encoding": "json"}
+    assert stream_options_from_handshake({"partial_interval_ms": 250})["partial_interval"] == 0.25
+    with pytest.raises(ValueError):
+        stream_options_from_handshake({"partials": "sometimes"})
+    with pytest.raises(ValueError):
+        stream_options_from_handshake({"message_encoding": "xml"})
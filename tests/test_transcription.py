@@ -0,0 +1,258 @@
+import asyncio
+import io
+import json
+import os
+import time
+import wave
+import httpx
+import pytest
+from fastapi.testclient import TestClient
+from app import admission, decoder, main, models, services, transcription
+
+# Pruebas de la respuesta incremental de /transcribe, con un reconocedor falso y un WAV
+# ya conforme (así no hace falta FFmpeg ni un modelo de Vosk).
+
+class FakeRecognizer:
+    """Reconoce una "frase" cada 16000 bytes (0.5 s de audio)."""
+
+    def __init__(self, sample_rate, model):
+        self.Reset()
+
+    def SetWords(self, enable):
+        pass
+
+    def Reset(self):
+        self.received = 0
+        self.phrases = 0
+
+    def AcceptWaveform(self, data):
+        self.received += len(data)
+        return self.received >= 16000 * (self.phrases + 1)
+
+    def Result(self):
+        self.phrases += 1
+        start = (self.phrases - 1) * 0.5
+        return json.dumps({
+            "text": f"frase {self.phrases}",
+            "result": [{"word": "frase", "start": start, "end": start + 0.4, "conf": 1.0}],
+        })
+
+    def FinalResult(self):
+        return json.dumps({"text": ""})
+
+class ChannelRecognizer(FakeRecognizer):
+    """Como FakeRecognizer, pero el texto dice qué muestra recibió (para distinguir los canales)."""
+
+    def AcceptWaveform(self, data):
+        self.sample = data[0]
+        return super().AcceptWaveform(data)
+
+    def Result(self):
+        result = json.loads(super().Result())
+        return json.dumps(dict(result, text=f"canal {self.sample}"))
+
+def _wav(seconds, frame=b"\x01\x00", channels=1):
+    data = io.BytesIO()
+    with wave.open(data, "wb") as wav:
+        wav.setnchannels(channels)
+        wav.setsampwidth(2)
+        wav.setframerate(16000)
+        wav.writeframes(frame * int(16000 * seconds))
+    data.seek(0)
+    return data
+
+def test_stream_segments_yields_each_phrase_with_timestamps(monkeypatch, tmp_path):
+    monkeypatch.setattr(models, "MODEL_REGISTRY", models.ModelRegistry({"default": str(tmp_path)}, loader=str))
+    monkeypatch.setattr(services, "RECOGNIZER_POOL", services.RecognizerPool(factory=FakeRecognizer))
+
+    async def scenario():
+        monkeypatch.setattr(decoder, "DECODE_EXECUTOR", decoder.DecodeExecutor(workers=1))
+        try:
+            return [message async for message in transcription.stream_segments(_wav(1.5))]
+        finally:
+            decoder.DECODE_EXECUTOR.shutdown()
+
+    messages = asyncio.run(scenario())
+    assert [m["type"] for m in messages] == ["final", "final", "final", "done"]
+    assert messages[1]["start"] == 0.5 and messages[1]["words"][0]["word"] == "frase"
+    assert messages[-1]["text"] == "frase 1 frase 2 frase 3"
+    # El reconocedor y el modelo quedan libres al terminar.
+    assert services.RECOGNIZER_POOL.stats()["idle"] == 1
+    assert models.MODEL_REGISTRY.get().refs == 0
+
+
+def test_multichannel_decodes_each_channel_separately(monkeypatch, tmp_path):
+    monkeypatch.setattr(models, "MODEL_REGISTRY", models.ModelRegistry({"default": str(tmp_path)}, loader=str))
+    monkeypatch.setattr(services, "RECOGNIZER_POOL", services.RecognizerPool(factory=ChannelRecognizer))
+    # WAV estéreo: el canal izquierdo vale 1 y el derecho 2 (se lee sin FFmpeg).
+    source = _wav(1.0, frame=b"\x01\x00\x02\x00", channels=2)
+
+    async def scenario():
+        monkeypatch.setattr(decoder, "DECODE_EXECUTOR", decoder.DecodeExecutor(workers=2))
+        try:
+            entry = await models.MODEL_REGISTRY.acquire()
+            return await transcription.transcribe_upload_multichannel(source, entry)
+        finally:
+            decoder.DECODE_EXECUTOR.shutdown()
+
+    result = asyncio.run(scenario())
+    assert result["channels"] == ["canal 1 canal 1", "canal 2 canal 2"]
+    # Segmentos de los dos canales en una sola línea de tiempo.
+    assert [(s["channel"], s["start"]) for s in result["segments"]] == [(0, 0.0), (1, 0.0), (0, 0.5), (1, 0.5)]
+    assert result["text"] == "canal 1 canal 2 canal 1 canal 2"
+    # Un reconocedor por canal, todos de vuelta en el pool.
+    assert services.RECOGNIZER_POOL.stats()["idle"] == 2
+
+
+def test_streamed_response_releases_file_job_if_client_leaves_before_first_chunk(monkeypatch):
+    controller = admission.AdmissionController(max_file_jobs=1)
+    monkeypatch.setattr(admission, "ADMISSION", controller)
+    assert controller.admit_file_job()
+    started = []
+
+    async def body():
+        started.append(True)
+        yield "nunca se envía\n"
+
+    async def receive():
+        return {"type": "http.disconnect"}
+
+    async def send(message):
+        # El cliente ya se fue: falla el envío de las cabeceras.
+        raise OSError("connection reset")
+
+    response = main._FileJobStreamingResponse(body(), media_type="application/x-ndjson")
+    try:
+        asyncio.run(response({"type": "http", "asgi": {"spec_version": "2.4"}}, receive, send))
+    except Exception:
+        pass
+    # El generador no llegó a arrancar, pero el hueco de MAX_FILE_JOBS queda libre.
+    assert not started
+    assert controller.file_jobs == 0
+
+
+def test_transcribe_streams_ndjson_and_sse(monkeypatch, tmp_path):
+    monkeypatch.setattr(models, "discover_models", lambda: {"default": str(tmp_path)})
+    monkeypatch.setattr(services, "load_vosk_model", lambda path: "modelo")
+    monkeypatch.setattr(services, "create_recognizer", FakeRecognizer)
+
+    with TestClient(main.app) as client:
+        response = client.post("/transcribe?stream=ndjson", files={"file": ("a.wav", _wav(1), "audio/wav")})
+        assert response.status_code == 200
+        assert response.headers["content-type"] == "application/x-ndjson"
+        lines = [json.loads(line) for line in response.text.splitlines()]
+        assert [line["type"] for line in lines] == ["final", "final", "done"]
+        assert lines[-1]["text"] == "frase 1 frase 2"
+
+        response = client.post("/transcribe?stream=sse", files={"file": ("a.wav", _wav(1), "audio/wav")})
+        assert response.status_code == 200
+        assert response.headers["content-type"].startswith("text/event-stream")
+        events = response.text.strip().split("\n\n")
+        assert [event.splitlines()[0] for event in events] == ["event: final", "event: final", "event: done"]
+        assert json.loads(events[-1].splitlines()[1][len("data: "):])["text"] == "frase 1 frase 2"
+
+        # Un formato desconocido se rechaza antes de admitir el archivo (422, como el resto de parámetros).
+        response = client.post("/transcribe?stream=xml", files={"file": ("a.wav", _wav(1), "audio/wav")})
+        assert response.status_code == 422
+        assert admission.ADMISSION.file_jobs == 0
+
+
+def test_streamed_response_releases_everything_if_client_leaves_mid_stream(monkeypatch, tmp_path):
+    monkeypatch.setattr(models, "MODEL_REGISTRY", models.ModelRegistry({"default": str(tmp_path)}, loader=str))
+    monkeypatch.setattr(services, "RECOGNIZER_POOL", services.RecognizerPool(factory=FakeRecognizer))
+    monkeypatch.setattr(admission, "ADMISSION", admission.AdmissionController(max_file_jobs=1))
+    # Cuerpo multipart de la petición, codificado por httpx.
+    request = httpx.Request("POST", "http://test/transcribe", files={"file": ("a.wav", _wav(2), "audio/wav")})
+    body = request.read()
+    scope = {
+        "type": "http", "asgi": {"version": "3.0", "spec_version": "2.4"}, "http_version": "1.1",
+        "method": "POST", "scheme": "http", "path": "/transcribe", "raw_path": b"/transcribe",
+        "query_string": b"stream=ndjson", "root_path": "", "server": ("test", 80), "client": ("test", 1),
+        "headers": [(k.lower().encode(), v.encode()) for k, v in request.headers.items()],
+    }
+    received = []
+
+    async def receive():
+        return {"type": "http.request", "body": body, "more_body": False}
+
+    async def send(message):
+        if message["type"] == "http.response.body" and message.get("body"):
+            if received:
+                # El cliente se va después de leer el primer segmento.
+                raise OSError("connection reset")
+            received.append(json.loads(message["body"]))
+
+    async def scenario():
+        monkeypatch.setattr(decoder, "DECODE_EXECUTOR", decoder.DecodeExecutor(workers=1))
+        try:
+            with pytest.raises(Exception):
+                await main.app(scope, receive, send)
+            # Con el loop todavía en marcha (sin esperar a que se cierren los generadores al
+            # terminar), el hueco de MAX_FILE_JOBS, el reconocedor y el modelo ya están libres.
+            assert admission.ADMISSION.file_jobs == 0
+            assert services.RECOGNIZER_POOL.stats()["in_use"] == 0
+            assert models.MODEL_REGISTRY.entries["default"].refs == 0
+        finally:
+            decoder.DECODE_EXECUTOR.shutdown()
+
+    asyncio.run(scenario())
+    assert [message["type"] for message in received] == ["final"]
+
+
+def test_parallel_mode_converts_to_a_temporary_file(monkeypatch, tmp_path):
+    # FFmpeg falso que copia la entrada (PCM crudo) a la salida.
+    ffmpeg = tmp_path / "ffmpeg"
+    ffmpeg.write_text("#!/bin/sh\nexec cat\n")
+    ffmpeg.chmod(0o755)
+    monkeypatch.setenv("PATH", f"{tmp_path}{os.pathsep}{os.environ['PATH']}")
+    monkeypatch.setattr(services, "RECOGNIZER_POOL", services.RecognizerPool(factory=FakeRecognizer))
+    source = io.BytesIO(b"\x01\x00" * 16000)
+
+    async def scenario():
+        monkeypatch.setattr(decoder, "DECODE_EXECUTOR", decoder.DecodeExecutor(workers=1))
+        try:
+            return await transcription.transcribe_upload_parallel(source, models.ModelEntry("default", str(tmp_path)))
+        finally:
+            decoder.DECODE_EXECUTOR.shutdown()
+
+    result = asyncio.run(scenario())
+    assert result["text"] == "frase 1 frase 2"
+    assert [(s["start"], s["end"]) for s in result["segments"]] == [(0.0, 1.0)]
+
+
+def test_parallel_mode_stops_every_segment_when_one_fails(monkeypatch, tmp_path):
+    calls = []
+
+    class FailingRecognizer(FakeRecognizer):
+        created = 0
+
+        def __init__(self, sample_rate, model):
+            super().__init__(sample_rate, model)
+            self.fails = FailingRecognizer.created == 0
+            FailingRecognizer.created += 1
+
+        def AcceptWaveform(self, data):
+            if self.fails:
+                raise RuntimeError("fallo de Kaldi")
+            calls.append(len(data))
+            time.sleep(0.01)
+            return False
+
+    monkeypatch.setattr(services, "RECOGNIZER_POOL", services.RecognizerPool(factory=FailingRecognizer))
+    # Tres segmentos de 1 s.
+    monkeypatch.setattr(transcription.audio, "find_silence_cuts", lambda pcm: [16000, 32000])
+
+    async def scenario():
+        monkeypatch.setattr(decoder, "DECODE_EXECUTOR", decoder.DecodeExecutor(workers=3))
+        try:
+            with pytest.raises(RuntimeError):
+                await transcription.transcribe_upload_parallel(_wav(3), models.ModelEntry("default", str(tmp_path)))
+            # Al fallar un segmento, los demás ya están cancelados (no siguen con el buffer liberado).
+            assert asyncio.all_tasks() == {asyncio.current_task()}
+            made = len(calls)
+            await asyncio.sleep(0.1)
+            assert len(calls) == made
+        finally:
+            decoder.DECODE_EXECUTOR.shutdown()
+
+    asyncio.run(scenario())
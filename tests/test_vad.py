@@ -0,0 +1,54 @@
+import numpy as np
+import pytest
+from app.vad import VoiceActivityGate, gate_from_handshake
+
+# Pruebas del detector de actividad de voz usado en /ws/transcribe.
+
+RATE = 16000
+
+def _tone(seconds):
+    t = np.arange(int(seconds * RATE)) / RATE
+    return (6000 * np.sin(2 * np.pi * 300 * t)).astype("<i2").tobytes()
+
+def _silence(seconds):
+    return np.zeros(int(seconds * RATE), dtype="<i2").tobytes()
+
+def _noise(seconds):
+    # Ruido blanco de nivel moderado: muchos cruces por cero.
+    rng = np.random.default_rng(0)
+    return rng.integers(-600, 600, int(seconds * RATE)).astype("<i2").tobytes()
+
+def test_gate_drops_silence_and_keeps_preroll():
+    """
+    El silencio inicial se descarta salvo el pre-roll y la voz pasa completa.
+    """
+    gate = VoiceActivityGate(RATE, preroll_ms=200, hangover_ms=100, final_silence_ms=500)
+    passed, force_final = gate.process(_silence(2) + _tone(1))
+    # 200 ms de pre-roll + 1 s de voz.
+    assert len(passed) == len(_silence(0.2)) + len(_tone(1))
+    assert not force_final
+
+def test_gate_forces_final_after_trailing_silence():
+    gate = VoiceActivityGate(RATE, preroll_ms=200, hangover_ms=100, final_silence_ms=500)
+    gate.process(_tone(1))
+    passed, force_final = gate.process(_silence(0.3))
+    # Solo pasa el 'hangover' (100 ms) y todavía no se fuerza el final.
+    assert len(passed) == len(_silence(0.1))
+    assert not force_final
+    passed, force_final = gate.process(_silence(0.3))
+    assert passed == b""
+    assert force_final
+    # El final solo se fuerza una vez por frase.
+    assert gate.process(_silence(1)) == (b"", False)
+
+def test_gate_rejects_line_noise():
+    gate = VoiceActivityGate(RATE, energy_threshold=300)
+    passed, _ = gate.process(_noise(1))
+    assert passed == b""
+
+def test_gate_from_handshake():
+    assert gate_from_handshake(None) is None
+    assert isinstance(gate_from_handshake(True), VoiceActivityGate)
+    assert gate_from_handshake({"final_silence_ms": 1000}).final_silence_frames == 50
+    with pytest.raises(ValueError):
+        gate_from_handshake({"frame_ms": "x"})
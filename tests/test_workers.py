@@ -0,0 +1,103 @@
+import gc
+import json
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+import pytest
+from app import workers
+
+# Pruebas del pool de procesos de decodificación. En lugar del modelo real de Vosk
+# usamos un reconocedor falso; como los hijos se crean con fork(), heredan el parche.
+
+class FakeRecognizer:
+    def __init__(self, model, sample_rate):
+        self.model = model
+        self.sample_rate = sample_rate
+        self.received = 0
+
+    def AcceptWaveform(self, data):
+        self.received += len(data)
+        return False
+
+    def FinalResult(self):
+        return json.dumps({"text": f"{self.model} {self.received} {os.getpid()}"})
+
+
+def test_remote_recognizers_run_in_child_processes(monkeypatch):
+    """
+    Cada reconocedor remoto vive en un proceso hijo y conserva su propio estado.
+    """
+    monkeypatch.setattr(workers, "KaldiRecognizer", FakeRecognizer)
+    pool = workers.WorkerPool("modelo-compartido", processes=2)
+    try:
+        first = pool.recognizer(16000)
+        second = pool.recognizer(16000)
+        first.AcceptWaveform(b"\x00" * 10)
+        first.AcceptWaveform(b"\x00" * 5)
+        second.AcceptWaveform(b"\x00" * 7)
+
+        model, received, pid = json.loads(first.FinalResult())["text"].split()
+        assert model == "modelo-compartido"
+        assert received == "15"
+        assert int(pid) != os.getpid()
+        # Las sesiones se reparten entre los procesos (afinidad al menos cargado).
+        assert json.loads(second.FinalResult())["text"].split()[2] != pid
+
+        # Al liberar el reconocedor, el proceso deja de contarlo como sesión activa.
+        del first
+        gc.collect()
+        assert sorted(w.sessions for w in pool.workers) == [0, 1]
+    finally:
+        pool.stop()
+
+
+def test_dead_workers_are_taken_out_of_rotation(monkeypatch):
+    monkeypatch.setattr(workers, "KaldiRecognizer", FakeRecognizer)
+    pool = workers.WorkerPool("modelo-compartido", processes=2)
+    try:
+        dead, alive = pool.workers
+        dead.process.kill()
+        dead.process.join()
+        # Todas las sesiones nuevas van al proceso que sigue vivo, aunque tenga más sesiones.
+        alive.sessions = 5
+        recognizer = pool.recognizer(16000)
+        recognizer.AcceptWaveform(b"\x00")
+        assert pool.workers == [alive]
+        assert int(json.loads(recognizer.FinalResult())["text"].split()[2]) == alive.process.pid
+
+        alive.process.kill()
+        alive.process.join()
+        with pytest.raises(workers.WorkerError):
+            pool.recognizer(16000)
+    finally:
+        pool.stop()
+
+
+def test_recognizers_can_be_created_from_several_threads_while_a_worker_dies(monkeypatch):
+    """
+    Los reconocedores se crean desde los hilos del ejecutor: la lista de procesos y los
+    contadores de sesiones no se corrompen aunque un proceso muera en medio.
+    """
+    monkeypatch.setattr(workers, "KaldiRecognizer", FakeRecognizer)
+    pool = workers.WorkerPool("modelo-compartido", processes=3)
+    dying = pool.workers[0]
+    start = threading.Barrier(8)
+
+    def create(i):
+        start.wait()
+        if i == 0:
+            dying.process.kill()
+            dying.process.join()
+        return [pool.recognizer(16000) for _ in range(50)]
+
+    try:
+        with ThreadPoolExecutor(max_workers=8) as threads:
+            created = [r for batch in threads.map(create, range(8)) for r in batch]
+        assert dying not in pool.workers and len(pool.workers) == 2
+        # Cada reconocedor cuenta exactamente una sesión en su proceso.
+        everyone = [dying] + pool.workers
+        assert sum(w.sessions for w in everyone) == len(created) == 400
+        counts = [w.sessions for w in pool.workers]
+        assert max(counts) - min(counts) <= 1
+    finally:
+        pool.stop()